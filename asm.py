@@ -0,0 +1,296 @@
+#
+# two-pass assembler for c6502. the first pass parses every line once,
+# sizes it and places labels; the second evaluates operands and fills a
+# 64K buffer. the output is one (addr, data) segment per contiguous run of
+# bytes written, as loader.py's parsers return them, so the gaps between
+# .org sections are left alone when loaded.
+#
+#   label:  LDA #<table     ; comment
+#           STA ($10),Y
+#   count = $20             ; constant
+#           .org $1000
+#           .byte 1, 'a', "text", count * 2
+#           .word label, * + 4
+
+import re
+from collections import namedtuple
+
+import instructions
+
+
+Program = namedtuple('Program', 'start segments labels')  # start: lowest byte
+
+# (mnemonic, mode): opcode
+_opcodes = dict(((func.__name__, mode), opcode) for opcode, (func, mode, cycles)
+                in instructions._instructions.items())
+_mnemonics = frozenset(mnemonic for mnemonic, mode in _opcodes)
+
+
+class _Undefined(Exception):
+    pass
+
+
+#
+# expressions: $hex, %binary, decimal, 'c', names, * (pc), + - * / & | ^
+# << >>, unary - ~ < (low byte) > (high byte), parentheses.
+
+_token = re.compile(r"""\s*(?:\$([0-9a-fA-F]+)|%([01]+)|(\d+)|'(.)'|"""
+                    r"""([A-Za-z_]\w*)|(<<|>>|[-+*/&|^~<>()]))""")
+_binary = {
+    '|': (1, lambda a, b: a | b), '^': (2, lambda a, b: a ^ b),
+    '&': (3, lambda a, b: a & b), '<<': (4, lambda a, b: a << b),
+    '>>': (4, lambda a, b: a >> b), '+': (5, lambda a, b: a + b),
+    '-': (5, lambda a, b: a - b), '*': (6, lambda a, b: a * b),
+    '/': (6, lambda a, b: a // b),
+}
+
+
+def _tokenize(text):
+    tokens, pos, text = [], 0, text.rstrip()
+    while pos < len(text):
+        m = _token.match(text, pos)
+        if m is None:
+            raise ValueError('bad expression %r' % text)
+        hexa, binary, decimal, char, name, op = m.groups()
+        if hexa is not None:
+            tokens.append(int(hexa, 16))
+        elif binary is not None:
+            tokens.append(int(binary, 2))
+        elif decimal is not None:
+            tokens.append(int(decimal))
+        elif char is not None:
+            tokens.append(ord(char))
+        else:
+            tokens.append(name or op)
+        pos = m.end()
+    return tokens
+
+
+def evaluate(text, names, pc=0x0):
+    # raises _Undefined for names not (yet) in names.
+    tokens = _tokenize(text)
+    if not tokens:
+        raise ValueError('missing expression')
+
+    def operand(i):
+        token = tokens[i] if i < len(tokens) else None
+        if isinstance(token, int):
+            return token, i + 1
+        if token == '*':
+            return pc, i + 1
+        if token == '(':
+            val, i = expr(i + 1, 0)
+            if i >= len(tokens) or tokens[i] != ')':
+                raise ValueError('unbalanced parentheses in %r' % text)
+            return val, i + 1
+        if token in ('-', '~', '<', '>'):
+            val, i = operand(i + 1)
+            return {'-': -val, '~': ~val, '<': val & 0xff,
+                    '>': (val >> 8) & 0xff}[token], i
+        if token is None or token in _binary or token == ')':
+            raise ValueError('bad expression %r' % text)
+        if token not in names:
+            raise _Undefined(token)
+        return names[token], i + 1
+
+    def expr(i, power):
+        val, i = operand(i)
+        while i < len(tokens) and tokens[i] in _binary:
+            bind, func = _binary[tokens[i]]
+            if bind <= power:
+                break
+            rhs, i = expr(i + 1, bind)
+            val = func(val, rhs)
+        return val, i
+
+    val, i = expr(0, 0)
+    if i != len(tokens):
+        raise ValueError('bad expression %r' % text)
+    return val
+
+
+#
+# lines.
+
+_line = re.compile(r'\s*(?:([A-Za-z_]\w*):)?\s*(.*)$')
+_constant = re.compile(r'([A-Za-z_]\w*)\s*=\s*(.+)$')
+_statement = re.compile(r'(\.?[A-Za-z]+)\s*(.*)$')
+_code = re.compile(r"""(?:"[^"]*"|'.'|[^;"'])*""")  # up to a comment
+_args = re.compile(r"""(?:"[^"]*"|'.'|[^,"'])+""")
+
+_operands = (  # (pattern, mode or (zero page, absolute))
+    (re.compile(r'#(.+)$'), 'imm'),
+    (re.compile(r'\((.+),\s*[xX]\s*\)$'), 'iix'),
+    (re.compile(r'\((.+)\)\s*,\s*[yY]$'), 'iiy'),
+    (re.compile(r'(.+),\s*[xX]$'), ('zpx', 'abx')),
+    (re.compile(r'(.+),\s*[yY]$'), ('zpy', 'aby')),
+)
+
+
+def _split(text):
+    return [arg.strip() for arg in _args.findall(text) if arg.strip()]
+
+
+def _enclosed(text):
+    # True for (expr) as a whole, as opposed to e.g. (a) + (b).
+    tokens, depth = _tokenize(text), 0
+    for i, token in enumerate(tokens):
+        depth += (token == '(') - (token == ')')
+        if not depth:
+            return token == ')' and i == len(tokens) - 1
+    return False
+
+
+def _mode(mnemonic, operand, names, pc):
+    # (mode, operand expression) for an instruction, sized with what the
+    # first pass knows: unresolved operands take the absolute form.
+    if not operand or operand in ('a', 'A'):
+        for mode in ('imp', 'acc'):
+            if (mnemonic, mode) in _opcodes:
+                return mode, None
+        raise ValueError('%s needs an operand' % mnemonic)
+    if (mnemonic, 'rel') in _opcodes:
+        return 'rel', operand
+
+    for pattern, modes in _operands:
+        m = pattern.match(operand)
+        if m:
+            break
+    else:
+        m, modes = None, ('zpg', 'abs')
+    text = operand if m is None else m.group(1)
+
+    if not isinstance(modes, str) and _enclosed(text):  # (addr), (addr),x
+        if modes[0] == 'zpg' and (mnemonic, 'ind') in _opcodes:
+            return 'ind', text.strip()[1:-1]
+        raise ValueError('addressing mode not available for %s' % mnemonic)
+    if isinstance(modes, str):
+        return modes, text
+    short, full = modes
+    if (mnemonic, short) in _opcodes:
+        if (mnemonic, full) not in _opcodes:
+            return short, text
+        try:
+            if 0 <= evaluate(text, names, pc) <= 0xff:
+                return short, text
+        except _Undefined:
+            pass
+    return full, text
+
+
+#
+# assembling.
+
+def assemble(source, org=0x0):
+    names, items, pc = {}, [], org
+
+    # pass 1: sizes and labels.
+    for lineno, line in enumerate(source.splitlines(), 1):
+        try:
+            label, rest = _line.match(_code.match(line).group()).groups()
+            if label:
+                names[label] = pc
+            rest = rest.strip()
+            if not rest:
+                continue
+
+            m = _constant.match(rest)
+            if m:
+                name, text = m.groups()
+                try:
+                    names[name] = evaluate(text, names, pc)
+                except _Undefined:
+                    pass
+                items.append((lineno, pc, '=', name, text))
+                continue
+
+            word, operand = _statement.match(rest).groups()
+            word = word.lower() if word[0] == '.' else word.upper()
+            if word == '.org':
+                pc = evaluate(operand, names, pc)
+            elif word in ('.byte', '.word'):
+                args = _split(operand)
+                items.append((lineno, pc, word, None, args))
+                size = 2 if word == '.word' else 1
+                pc += sum(len(arg) - 2 if arg[0] == '"' else size
+                          for arg in args)
+            elif word in _mnemonics:
+                mode, text = _mode(word, operand.strip(), names, pc)
+                if (word, mode) not in _opcodes:
+                    raise ValueError('addressing mode not available for %s'
+                                     % word)
+                items.append((lineno, pc, _opcodes[word, mode], mode, text))
+                pc += instructions._sizes[mode]
+            else:
+                raise ValueError('unknown instruction %r' % word)
+            if pc > 0x10000:
+                raise ValueError('past $ffff')
+        except _Undefined as error:
+            raise ValueError('line %d: undefined %s' % (lineno, error))
+        except ValueError as error:
+            raise ValueError('line %d: %s' % (lineno, error))
+
+    # pass 2: operands.
+    buf = bytearray(0x10000)
+    spans = []
+    for lineno, pc, kind, mode, args in items:
+        try:
+            if kind == '=':
+                names[mode] = evaluate(args, names, pc)
+                continue
+
+            if kind == '.byte':
+                out = bytearray()
+                for arg in args:
+                    if arg[0] == '"':
+                        out += arg[1:-1].encode('latin-1')
+                    else:
+                        out.append(evaluate(arg, names, pc) & 0xff)
+            elif kind == '.word':
+                out = bytearray()
+                for arg in args:
+                    val = evaluate(arg, names, pc) & 0xffff
+                    out += bytes((val & 0xff, val >> 8))
+            else:
+                out = bytearray((kind,))
+                if args is not None:
+                    val = evaluate(args, names, pc)
+                    if mode == 'rel':
+                        val -= pc + 2
+                        if not -0x80 <= val <= 0x7f:
+                            raise ValueError('branch out of range')
+                        out.append(val & 0xff)
+                    elif instructions._sizes[mode] == 2:
+                        if mode == 'imm':
+                            if not -0x80 <= val <= 0xff:
+                                raise ValueError('#$%x is not a byte' % val)
+                        elif not 0 <= val <= 0xff:
+                            raise ValueError('$%x is not on the zero page' % val)
+                        out.append(val & 0xff)
+                    else:
+                        out += bytes((val & 0xff, (val >> 8) & 0xff))
+        except _Undefined as error:
+            raise ValueError('line %d: undefined %s' % (lineno, error))
+        except ValueError as error:
+            raise ValueError('line %d: %s' % (lineno, error))
+
+        if out:
+            buf[pc:pc + len(out)] = out
+            spans.append((pc, pc + len(out)))
+
+    # merge touching and overlapping spans into segments.
+    runs = []
+    for start, end in sorted(spans):
+        if runs and start <= runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], end)
+        else:
+            runs.append([start, end])
+    segments = [(start, bytes(buf[start:end])) for start, end in runs]
+    return Program(runs[0][0] if runs else org, segments, names)
+
+
+def assemble_into(cpu, source, org=0x0):
+    program = assemble(source, org)
+    for addr, data in program.segments:
+        cpu.ram.load(addr, data)
+    return program
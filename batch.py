@@ -0,0 +1,91 @@
+#
+# batch runner; shards independent c6502 jobs across a process pool. images
+# travel through one shared memory block instead of being pickled per job,
+# and each job sends back only its registers and a digest of ram.
+
+import hashlib
+import multiprocessing
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from c6502 import C6502
+from translate import Translator
+
+
+# stop is a dict of C6502.run() keywords, e.g. {'cycles': 10 ** 6}.
+Job = namedtuple('Job', 'image addr entry stop')
+Result = namedtuple('Result', 'index a x y sp p pc cycles instructions reason '
+                              'digest')
+
+_shared = None  # worker side: the attached image block
+
+
+def _attach(name):
+    # pool workers share the parent's resource tracker, so attaching here
+    # does not take ownership; the parent unlinks the block.
+    global _shared
+    _shared = shared_memory.SharedMemory(name)
+
+
+def _execute(task, buf=None):
+    index, offset, length, addr, entry, stop, translate = task
+    buf = _shared.buf if buf is None else buf
+
+    cpu = C6502()
+    image = buf[offset:offset + length]
+    try:
+        cpu.ram.load(addr, image)
+    finally:
+        image.release()
+    cpu.PC = entry
+
+    engine = Translator(cpu) if translate else cpu
+    result = engine.run(**stop)
+
+    return Result(index, cpu.A, cpu.X, cpu.Y, cpu.SP, cpu.P, cpu.PC,
+                  cpu.cycles, result.instructions, result.reason,
+                  hashlib.sha1(cpu.ram.image()).hexdigest())
+
+
+def _pack(jobs, translate):
+    # lays the distinct images out back to back; returns the tasks, the
+    # images by offset and the total size.
+    offsets, images, tasks, size = {}, {}, [], 0
+    for index, job in enumerate(jobs):
+        key = id(job.image)
+        if key not in offsets:
+            offsets[key] = size
+            images[size] = job.image
+            size += len(job.image)
+        tasks.append((index, offsets[key], len(job.image), job.addr or 0x0,
+                      job.entry, dict(job.stop or {}), translate))
+    return tasks, images, size
+
+
+def _fill(buf, images):
+    for offset, image in images.items():
+        buf[offset:offset + len(image)] = image
+
+
+def run_batch(jobs, processes=None, chunksize=8, translate=False):
+    # yields a Result per job as workers finish them, in completion order;
+    # Result.index is the job's position in jobs.
+    tasks, images, size = _pack(list(jobs), translate)
+
+    if processes == 1:  # in-process, for debugging
+        buf = bytearray(size)
+        _fill(buf, images)
+        view = memoryview(buf)
+        for task in tasks:
+            yield _execute(task, view)
+        return
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        _fill(shm.buf, images)
+        with multiprocessing.Pool(processes, _attach, (shm.name,)) as pool:
+            for result in pool.imap_unordered(_execute, tasks, chunksize):
+                yield result
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,341 @@
+#
+# throughput benchmarks for c6502. runs a set of small programs (and
+# optionally a functional test rom) through each engine, reports
+# instructions/s and emulated cycles/s, times every opcode handler on its
+# own, and keeps the numbers as json so runs can be compared.
+#
+#   python bench.py [-e step,run,translate] [-r rom.bin] [-o out.json]
+#                   [-c baseline.json]
+
+import argparse
+import hashlib
+import json
+import platform
+import time
+
+import asm
+import instructions
+from c6502 import C6502, _dispatch
+from translate import Translator
+
+
+#
+# workloads. each stops at its BRK.
+
+_loop = '''
+        LDX #0
+        LDY #0
+loop:   DEX
+        BNE loop
+        DEY
+        BNE loop
+        BRK
+'''
+
+_memcpy = '''
+src = $10
+dst = $12
+rounds = $14
+        LDA #4
+        STA rounds
+again:  LDA #$00
+        STA src
+        STA dst
+        LDA #$20
+        STA src+1
+        LDA #$60
+        STA dst+1
+        LDX #$20
+        LDY #0
+copy:   LDA (src),Y
+        STA (dst),Y
+        INY
+        BNE copy
+        INC src+1
+        INC dst+1
+        DEX
+        BNE copy
+        DEC rounds
+        BNE again
+        BRK
+'''
+
+_sieve = '''
+ptr = $10
+i = $12
+flags = $4000
+        LDA #<flags
+        STA ptr
+        LDA #>flags
+        STA ptr+1
+        LDA #0
+        LDY #0
+        LDX #$20
+clear:  STA (ptr),Y
+        INY
+        BNE clear
+        INC ptr+1
+        DEX
+        BNE clear
+        LDA #2
+        STA i
+outer:  LDX i
+        LDA flags,X
+        BNE next
+        LDA #<flags
+        STA ptr
+        LDA #>flags
+        STA ptr+1
+square: CLC                     ; ptr += i * i
+        LDA ptr
+        ADC i
+        STA ptr
+        BCC nocarry
+        INC ptr+1
+nocarry: DEX
+        BNE square
+mark:   LDA #1
+        LDY #0
+        STA (ptr),Y
+        CLC
+        LDA ptr
+        ADC i
+        STA ptr
+        BCC checkend
+        INC ptr+1
+checkend: LDA ptr+1
+        CMP #>(flags + $2000)
+        BCC mark
+next:   INC i
+        LDA i
+        CMP #91
+        BNE outer
+        BRK
+'''
+
+_bcd = '''
+total = $10
+count = $14
+        LDA #<8000
+        STA count
+        LDA #>8000
+        STA count+1
+        SED
+add:    CLC
+        LDA total
+        ADC #1
+        STA total
+        LDA total+1
+        ADC #0
+        STA total+1
+        LDA total+2
+        ADC #0
+        STA total+2
+        LDA total+3
+        ADC #0
+        STA total+3
+        LDA count
+        BNE low
+        DEC count+1
+low:    DEC count
+        LDA count
+        ORA count+1
+        BNE add
+        CLD
+        BRK
+'''
+
+_recursion = '''
+rounds = $10
+        LDA #250
+        STA rounds
+again:  LDX #100
+        JSR descend
+        DEC rounds
+        BNE again
+        BRK
+descend: DEX
+        BEQ bottom
+        JSR descend
+bottom: RTS
+'''
+
+workloads = [
+    ('loop', _loop), ('memcpy', _memcpy), ('sieve', _sieve), ('bcd', _bcd),
+    ('recursion', _recursion),
+]
+engines = ('step', 'run', 'translate')
+
+_limit = 5 * 10 ** 6  # instructions, in case a workload runs away
+_slice = 10 ** 5
+
+
+#
+# engines.
+
+def _stepper(cpu):
+    def run(max_instructions=None, brk=True):
+        ram, step, count = cpu.ram, cpu.step, 0
+        limit = -1 if max_instructions is None else max_instructions
+        while count != limit:
+            if brk and ram.read(cpu.PC) == 0x00:
+                break
+            step()
+            count += 1
+        return count
+    return run
+
+
+def _engine(cpu, name):
+    # run(max_instructions, brk) -> instructions executed.
+    if name == 'step':
+        return _stepper(cpu)
+    engine = Translator(cpu) if name == 'translate' else cpu
+    return lambda max_instructions=None, brk=True: engine.run(
+        max_instructions=max_instructions, brk=brk).instructions
+
+
+def _trapped(cpu):
+    # JMP * or a branch to itself: how test roms report pass and fail.
+    ram, pc = cpu.ram, cpu.PC
+    opcode = ram.read(pc)
+    if opcode == 0x4c:
+        return ram.read(pc + 1) | (ram.read(pc + 2) << 8) == pc
+    return (instructions.get_mode(opcode) == 'rel' if opcode in
+            instructions._instructions else False) and ram.read(pc + 1) == 0xfe
+
+
+def _measure(cpu, run, brk=True, trap=False):
+    count, timer = 0, time.perf_counter
+    start, cycles = timer(), cpu.cycles
+    if trap:
+        while count < _limit and not _trapped(cpu):
+            count += run(_slice, brk)
+    else:
+        count = run(_limit, brk)
+    seconds = timer() - start
+    cycles = cpu.cycles - cycles
+    state = bytes((cpu.A, cpu.X, cpu.Y, cpu.SP, cpu.P)) + cpu.ram.image()
+    return {
+        'instructions': count, 'cycles': cycles, 'seconds': seconds,
+        'ips': count / seconds if seconds else 0.0,
+        'cps': cycles / seconds if seconds else 0.0,
+        'pc': cpu.PC, 'digest': hashlib.sha1(state).hexdigest(),
+    }
+
+
+def bench_workload(source, engine, org=0x0200):
+    cpu = C6502()
+    program = asm.assemble_into(cpu, source, org)
+    cpu.PC = program.start
+    return _measure(cpu, _engine(cpu, engine))
+
+
+def bench_rom(path, engine, addr=0x0, entry=0x0400, success=None):
+    # a functional test rom (e.g. 6502_functional_test.bin) traps in a jump
+    # or branch to itself; it passed if that is at success.
+    cpu = C6502()
+    with open(path, 'rb') as f:
+        cpu.ram.load(addr, f.read())
+    cpu.PC = entry
+    result = _measure(cpu, _engine(cpu, engine), brk=False, trap=True)
+    result['passed'] = None if success is None else cpu.PC == success
+    return result
+
+
+def opcode_costs(calls=20000):
+    # {opcode: ns per handler call}, over zeroed operands at $0200.
+    cpu, timer, costs = C6502(), time.perf_counter, {}
+    calls = range(calls)
+
+    start = timer()
+    for _ in calls:
+        cpu.PC = 0x0200
+    overhead = timer() - start
+
+    for opcode in sorted(instructions._instructions):
+        handler = _dispatch[opcode]
+        start = timer()
+        for _ in calls:
+            cpu.PC = 0x0200
+            handler(cpu)
+        costs[opcode] = max(timer() - start - overhead, 0.0) * 1e9 / len(calls)
+    return costs
+
+
+#
+# suite.
+
+def run_suite(engines=engines, rom=None, rom_addr=0x0, rom_entry=0x0400,
+              rom_success=None):
+    results = {}
+    for engine in engines:
+        results[engine] = dict((name, bench_workload(source, engine))
+                               for name, source in workloads)
+        if rom is not None:
+            results[engine]['rom'] = bench_rom(rom, engine, rom_addr,
+                                               rom_entry, rom_success)
+
+    costs = opcode_costs()
+    return {
+        'python': platform.python_implementation() + ' ' +
+                  platform.python_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+        'opcodes': dict(('%02x' % opcode, ns) for opcode, ns in costs.items()),
+    }
+
+
+def report(suite, top=10):
+    out = ['engine     workload     instructions      ips/s   cycles/s']
+    for engine, results in suite['results'].items():
+        for name, r in results.items():
+            out.append('%-10s %-10s %14d %10.0f %10.0f' % (
+                engine, name, r['instructions'], r['ips'], r['cps']))
+    out.append('')
+    out.append('slowest opcodes        ns/call')
+    costs = sorted(suite['opcodes'].items(), key=lambda item: -item[1])
+    for key, ns in costs[:top]:
+        opcode = int(key, 16)
+        func, mode, cycles = instructions._instructions[opcode]
+        out.append('0x%s %s %-4s %14.0f' % (key, func.__name__, mode, ns))
+    return '\n'.join(out)
+
+
+def compare(old, new):
+    # ips ratios new / old for every engine and workload in both.
+    out = ['engine     workload        old ips    new ips   ratio']
+    for engine, results in new['results'].items():
+        for name, r in results.items():
+            base = old['results'].get(engine, {}).get(name)
+            if base is None or not base['ips']:
+                continue
+            flag = '' if base['digest'] == r['digest'] else '  (state differs)'
+            out.append('%-10s %-10s %10.0f %10.0f %7.2fx%s' % (
+                engine, name, base['ips'], r['ips'], r['ips'] / base['ips'],
+                flag))
+    return '\n'.join(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='c6502 benchmarks')
+    parser.add_argument('-e', '--engines', default=','.join(engines))
+    parser.add_argument('-r', '--rom', help='functional test rom (raw)')
+    parser.add_argument('--rom-addr', type=lambda s: int(s, 16), default=0x0)
+    parser.add_argument('--rom-entry', type=lambda s: int(s, 16),
+                        default=0x0400)
+    parser.add_argument('--rom-success', type=lambda s: int(s, 16))
+    parser.add_argument('-o', '--output', help='write results as json')
+    parser.add_argument('-c', '--compare', help='baseline json to compare')
+    args = parser.parse_args()
+
+    suite = run_suite(args.engines.split(','), args.rom, args.rom_addr,
+                      args.rom_entry, args.rom_success)
+    print(report(suite))
+    if args.compare:
+        with open(args.compare) as f:
+            print('')
+            print(compare(json.load(f), suite))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(suite, f, indent=1, sort_keys=True)
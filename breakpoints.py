@@ -0,0 +1,150 @@
+#
+# breakpoints and watchpoints for c6502. pc breakpoints live in a 64K
+# bitmap and watchpoints in per-page memory hooks, so Debugger.run() costs
+# about what C6502.run() does until something actually hits.
+
+import re
+
+import instructions
+from c6502 import RunResult, _dispatch
+
+
+_lengths = bytes(instructions.get_size(op) if op in instructions._instructions
+                 else 1 for op in range(0x100))
+
+
+def parse_condition(expr):
+    # python expression over a, x, y, sp, pc, p and ram(addr); $ff is hex.
+    expr = re.sub(r'\$([0-9a-fA-F]+)', lambda m: str(int(m.group(1), 16)), expr)
+    code = compile(expr, '<condition>', 'eval')
+
+    def condition(cpu):
+        return eval(code, {'ram': cpu.ram}, {
+            'a': cpu.A, 'x': cpu.X, 'y': cpu.Y, 'sp': cpu.SP, 'pc': cpu.PC,
+            'p': cpu.P})
+
+    condition.expr = expr
+    return condition
+
+
+class Debugger:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self._breaks = bytearray(0x10000)
+        self.conditions = {}  # pc: condition(cpu), for conditional breaks
+        self._reads = set()
+        self._writes = set()
+        self.hits = []  # (kind, addr, val) caught during the current run
+        self.hit = None  # what stopped the last run, if anything did
+        self._pc = None  # instruction being run, while run() is running
+
+    #
+    # breakpoints.
+
+    def add_break(self, pc, condition=None):
+        self._breaks[pc] = 1
+        if condition is None:
+            self.conditions.pop(pc, None)
+        else:
+            self.conditions[pc] = condition
+
+    def remove_break(self, pc):
+        self._breaks[pc] = 0
+        self.conditions.pop(pc, None)
+
+    def breaks(self):
+        return [pc for pc in range(0x10000) if self._breaks[pc]]
+
+    #
+    # watchpoints.
+
+    def watch(self, addr, read=False, write=True):
+        ram, page = self.cpu.ram, addr >> 8
+        if read:
+            self._reads.add(addr)
+            ram.add_read_hook(page, self._on_read)
+        if write:
+            self._writes.add(addr)
+            ram.add_hook(page, self._on_write)
+
+    def unwatch(self, addr):
+        ram, page = self.cpu.ram, addr >> 8
+        self._reads.discard(addr)
+        self._writes.discard(addr)
+        if not any(a >> 8 == page for a in self._reads):
+            ram.remove_read_hook(page, self._on_read)
+        if not any(a >> 8 == page for a in self._writes):
+            ram.remove_hook(page, self._on_write)
+
+    def watches(self):
+        return sorted((addr, addr in self._reads, addr in self._writes)
+                      for addr in self._reads | self._writes)
+
+    def _on_read(self, addr):
+        # only within run(), and not for the instruction's own bytes.
+        pc = self._pc
+        if pc is not None and addr in self._reads and \
+                (addr - pc) & 0xffff >= _lengths[self.cpu.ram.peek(pc)]:
+            self.hits.append(('read', addr, None))
+
+    def _on_write(self, addr, val):
+        if self._pc is not None and addr in self._writes:
+            self.hits.append(('write', addr, val))
+
+    #
+    # execution.
+
+    def run(self, cycles=None, until_pc=None, max_instructions=None,
+            until=None, brk=True):
+        # same contract as C6502.run, plus reason 'break' before executing a
+        # breakpoint (other than the first instruction) and 'watch' after
+        # an instruction touching a watched address; self.hit says which.
+        cpu, dispatch, ram = self.cpu, _dispatch, self.cpu.ram
+        breaks, conditions, hits = self._breaks, self.conditions, self.hits
+        reads = self._reads
+        start = cpu.cycles
+        deadline = float('inf') if cycles is None else start + cycles
+        limit = -1 if max_instructions is None else max_instructions
+        stop_pc = -1 if until_pc is None else until_pc
+        stop_op = 0x00 if brk else -1
+        count, reason = 0, 'instructions'
+        del hits[:]
+        self.hit = None
+        self._pc = cpu.PC  # watchpoints count from here
+        cpu._arm(deadline)
+
+        try:
+            while count != limit:
+                if cpu.cycles >= cpu._deadline:
+                    if cpu.cycles >= deadline:
+                        reason = 'cycles'
+                        break
+                    cpu._service()
+                    continue
+                pc = cpu.PC
+                if breaks[pc] and count:
+                    condition = conditions.get(pc)
+                    if condition is None or condition(cpu):
+                        reason, self.hit = 'break', ('break', pc, None)
+                        break
+                if reads:
+                    self._pc = pc
+                opcode = ram.read(pc)
+                if opcode == stop_op:
+                    reason = 'brk'
+                    break
+                dispatch[opcode](cpu)
+                count += 1
+                if hits:
+                    reason, self.hit = 'watch', hits[0]
+                    break
+                if cpu.PC == stop_pc:
+                    reason = 'pc'
+                    break
+                if until is not None and until(cpu):
+                    reason = 'until'
+                    break
+        finally:
+            self._pc = None
+
+        return RunResult(count, cpu.cycles - start, reason)
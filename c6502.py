@@ -1,5 +1,43 @@
+import struct
+from collections import namedtuple
+
 import instructions
-from memory import Register, Flag, Memory
+from memory import Memory
+
+
+RunResult = namedtuple('RunResult', 'instructions cycles reason')
+
+# snapshot header; the 64K of ram follows it as a raw buffer.
+_state = struct.Struct('<4sBBBBBHQ')  # magic, a, x, y, sp, p, pc, cycles
+_magic = b'6502'
+
+# bits of C6502.pending.
+_irq = 0x1
+_nmi = 0x2
+_reset = 0x4
+
+
+#
+# callable accessors, kept so proto and older callers can keep using
+# cpu.acc(), cpu.pc(0x600), cpu.c() and so on.
+
+def _register(name, mask):
+    def access(self, val=None):
+        if val is None:
+            return getattr(self, name)
+        setattr(self, name, val & mask)
+    return access
+
+
+def _flag(mask):
+    def access(self, val=None):
+        if val is None:
+            return bool(self.P & mask)
+        if val:
+            self.P |= mask
+        else:
+            self.P &= ~mask & 0xff
+    return access
 
 
 #
@@ -7,62 +45,129 @@ from memory import Register, Flag, Memory
 
 
 class C6502:
-    def __init__(self):
-        self.acc = Register(1)
-        self.x = Register(1)
-        self.y = Register(1)
-        self.sp = Register(1, 0xff)
+    __slots__ = ('A', 'X', 'Y', 'SP', 'PC', 'P', '_sp_page', 'ram', 'cycles',
+                 'pending', '_irqs', '_end', '_deadline', 'scheduler', 'debug')
+
+    def __init__(self, ram=None):
+        self.A = 0x0
+        self.X = 0x0
+        self.Y = 0x0
+        self.SP = 0xff
         self._sp_page = 0x100  # 0x100, 0x200, 0x300, ...
-        self.pc = Register(2)
+        self.PC = 0x0
 
-        self.n = Flag()
-        self.v = Flag()
-        self.b = Flag()
-        self.d = Flag()
-        self.i = Flag(True)
-        self.z = Flag()
-        self.c = Flag()
+        self.P = 0x24  # N V - B D I Z C; bit 5 always reads as set.
 
-        self.ram = Memory()
+        self.ram = Memory() if ram is None else ram
+
+        self.cycles = 0  # total since power-on
+
+        # interrupts are latched into pending and taken at the next
+        # instruction boundary. run loops only compare cycles against
+        # _deadline, which is the end of the cycle budget (_end) or the next
+        # scheduled event, whichever is first; raising a line drops it to 0.
+        self.pending = 0x0
+        self._irqs = 0x0  # sources holding the irq line
+        self._end = float('inf')
+        self._deadline = float('inf')
+        self.scheduler = None  # set by scheduler.Scheduler(cpu)
 
         self.debug = False
 
+    acc = _register('A', 0xff)
+    x = _register('X', 0xff)
+    y = _register('Y', 0xff)
+    sp = _register('SP', 0xff)
+    pc = _register('PC', 0xffff)
+
+    n = _flag(0x80)
+    v = _flag(0x40)
+    b = _flag(0x10)
+    d = _flag(0x08)
+    i = _flag(0x04)
+    z = _flag(0x02)
+    c = _flag(0x01)
+
     def p(self, mem=None):
-        p = 0x0
         if mem is None:
-            flags = (self.n() << 7, self.v() << 6, 0x0, self.b() << 4,
-                     self.d() << 3, self.i() << 2, self.z() << 1, self.c())
-            for i in flags:
-                p = p | i
-            return p
-        else:
-            mem %= 0x100
-            val = ()
-            for bitpos in range(8):
-                val += (mem & (0x1 << bitpos),)
-            for bit in val:
-                p = p | bit
-            self._set_flags(p)
-
-    def _set_flags(self, p):
-        self.n(p & 0x80)
-        self.v(p & 0x40)
-        self.b(p & 0x20)
-        self.d(p & 0x10)
-        self.i(p & 0x8)
-        self.z(p & 0x4)
-        self.c(p & 0x1)
+            return self.P
+        self.P = (mem & 0xff) | 0x20
 
     def push(self, mem):  # stack
-        addr = self.sp() + self._sp_page
-        self.ram(addr, mem)
-        self.sp(self.sp() - 1)
+        self.ram.write(self.SP + self._sp_page, mem)
+        self.SP = (self.SP - 1) & 0xff
 
     def pull(self):
-        self.sp(self.sp() + 1)
-        addr = self.sp() + self._sp_page
-        mem = self.ram(addr)
-        return mem
+        self.SP = (self.SP + 1) & 0xff
+        return self.ram.read(self.SP + self._sp_page)
+
+    #
+    # interrupts.
+
+    def irq(self, source=0x1):
+        # level-triggered: pending until every source (a bit) releases it,
+        # and only taken while the I flag is clear.
+        self._irqs |= source
+        self.pending |= _irq
+        self._deadline = 0
+
+    def release_irq(self, source=0x1):
+        self._irqs &= ~source
+        if not self._irqs:
+            self.pending &= ~_irq
+
+    def nmi(self):
+        # edge-triggered: taken once, whatever the I flag.
+        self.pending |= _nmi
+        self._deadline = 0
+
+    def reset(self):
+        self.pending |= _reset
+        self._deadline = 0
+
+    def _enter(self, vector):
+        self.push(self.PC >> 8)
+        self.push(self.PC & 0xff)
+        self.push((self.P & 0xef) | 0x20)
+        self.P |= 0x04
+        self.PC = (self.ram.read(vector + 1) << 8) | self.ram.read(vector)
+        self.cycles += 7
+
+    def _arm(self, end):
+        # run loops call this with the end of their cycle budget.
+        self._end = end
+        if self.scheduler is not None:
+            end = min(end, self.scheduler.due)
+        self._deadline = 0 if self.pending else end
+
+    def _service(self):
+        # run loops call this once cycles reaches _deadline but not their
+        # budget's end: fires due events, takes a pending interrupt and sets
+        # the next deadline. a masked irq waits for CLI, PLP or RTI, which
+        # drop _deadline again.
+        scheduler, deadline = self.scheduler, self._end
+        if scheduler is not None:
+            if scheduler.due <= self.cycles:
+                scheduler.fire()
+            deadline = min(deadline, scheduler.due)
+        if self.pending:
+            self.interrupt()
+        self._deadline = deadline
+
+    def interrupt(self):
+        # takes the most urgent pending interrupt that can be taken.
+        pending = self.pending
+        if pending & _reset:
+            self.pending = pending & ~(_reset | _nmi)
+            self.SP = (self.SP - 3) & 0xff  # the pushes happen, as reads
+            self.P |= 0x04
+            self.PC = (self.ram.read(0xfffd) << 8) | self.ram.read(0xfffc)
+            self.cycles += 7
+        elif pending & _nmi:
+            self.pending = pending & ~_nmi
+            self._enter(0xfffa)
+        elif pending & _irq and not self.P & 0x04:
+            self._enter(0xfffe)
 
     #
     # addressing; imp -> None, literal -> unchanged, else -> abs.
@@ -74,10 +179,10 @@ class C6502:
         return mem
 
     def _addr_abx(self, mem):
-        return mem + self.x()
+        return (mem + self.X) & 0xffff
 
     def _addr_aby(self, mem):
-        return mem + self.y()
+        return (mem + self.Y) & 0xffff
 
     def _addr_imm(self, mem):
         return mem
@@ -86,34 +191,31 @@ class C6502:
         return None
 
     def _addr_ind(self, mem):  # to-do: hb should loop around page
-        lb = self.ram(mem)
-        hb = self.ram(mem + 1)
-        return (hb << 8) | lb
+        read = self.ram.read
+        return (read((mem + 1) & 0xffff) << 8) | read(mem)
 
     def _addr_iix(self, mem):
-        lb = self.ram(mem + self.x())
-        hb = self.ram(mem + self.x() + 1)
-        return (hb << 8) | lb
+        read = self.ram.read
+        mem = (mem + self.X) & 0xff
+        return (read((mem + 1) & 0xff) << 8) | read(mem)
 
     def _addr_iiy(self, mem):
-        lb = self.ram(mem)
-        hb = self.ram(mem + 1)
-        val = ((hb << 8) | lb) + self.y()
-        return val
+        read = self.ram.read
+        val = (read((mem + 1) & 0xff) << 8) | read(mem)
+        return (val + self.Y) & 0xffff
 
     def _addr_rel(self, mem):
-        negative = (mem >> 7) & 0x1
-        offset = 0 - (256 - mem) if negative else mem
-        return self.pc() + offset
+        offset = mem - 0x100 if mem & 0x80 else mem
+        return (self.PC + offset) & 0xffff
 
     def _addr_zpg(self, mem):
-        return mem % 0x100
+        return mem & 0xff
 
     def _addr_zpx(self, mem):
-        return mem + self.x()
+        return (mem + self.X) & 0xff
 
     def _addr_zpy(self, mem):
-        return mem + self.y()
+        return (mem + self.Y) & 0xff
 
     addr_modes = {
         'acc': _addr_acc, 'abs': _addr_abs, 'abx': _addr_abx, 'aby': _addr_aby,
@@ -122,40 +224,167 @@ class C6502:
         'zpy': _addr_zpy
     }
 
-    def _get_addr(self, mode, mem):
-        return self.addr_modes[mode](self, mem)
+    # variants for opcodes that take an extra cycle on a page crossing.
+
+    def _addr_abx_paged(self, mem):
+        addr = (mem + self.X) & 0xffff
+        if (addr ^ mem) & 0xff00:
+            self.cycles += 1
+        return addr
+
+    def _addr_aby_paged(self, mem):
+        addr = (mem + self.Y) & 0xffff
+        if (addr ^ mem) & 0xff00:
+            self.cycles += 1
+        return addr
+
+    def _addr_iiy_paged(self, mem):
+        read = self.ram.read
+        val = (read((mem + 1) & 0xff) << 8) | read(mem)
+        addr = (val + self.Y) & 0xffff
+        if (addr ^ val) & 0xff00:
+            self.cycles += 1
+        return addr
+
+    paged_modes = {
+        'abx': _addr_abx_paged, 'aby': _addr_aby_paged, 'iiy': _addr_iiy_paged
+    }
+
+    #
+    # machine state. devices mapped on the bus keep their own state.
+
+    def snapshot(self):
+        header = _state.pack(_magic, self.A, self.X, self.Y, self.SP, self.P,
+                             self.PC, self.cycles)
+        return header + self.ram.image()
+
+    def restore(self, blob):
+        magic, a, x, y, sp, p, pc, cycles = _state.unpack_from(blob)
+        if magic != _magic or len(blob) != _state.size + 0x10000:
+            raise ValueError('not a c6502 snapshot')
+        self.A, self.X, self.Y, self.SP, self.P, self.PC = a, x, y, sp, p, pc
+        self.cycles = cycles
+        self.ram.load(0x0, memoryview(blob)[_state.size:])
+
+    def fork(self):
+        # the child starts on the same ram pages as this cpu and copies a
+        # page only when it first writes to it; ram.dirty_pages() on either
+        # side lists what it has copied since. bus mappings and hooks stay
+        # with the parent, and its own writes turn copy-on-write as well
+        # until ram.unshare().
+        child = C6502(Memory(self.ram.share()))
+        child.A, child.X, child.Y, child.SP = self.A, self.X, self.Y, self.SP
+        child.PC, child.P, child.cycles = self.PC, self.P, self.cycles
+        child._sp_page, child.debug = self._sp_page, self.debug
+        return child
 
     #
     # higher-level functions.
 
-    def _get_bytes(self):
-        opcode, arg = self.ram(self.pc()), None
-        try:
-            size = instructions.get_size(opcode)
-        except KeyError:
-            print('invalid opcode! passing NOP...')
-            opcode, size = 0xea, instructions.get_size(0xea)
-        if size > 1:
-            lb = self.ram(self.pc() + 1)
-            if size == 2:
-                arg = lb
-            elif size == 3:
-                hb = self.ram(self.pc() + 2)
-                arg = (hb << 8) | lb
-        self.pc(self.pc() + size)
-
-        return opcode, arg  # int, int
-
-    def _prepare_instruction(self, opcode, arg):
-        instruction = instructions.get_instruction(opcode)
-        mode = instructions.get_mode(opcode)
-        arg = self._get_addr(mode, arg)
-        return instruction, mode, arg  # func, str, int
-
-    def _execute(self, instruction, mode, arg):
-        instruction(self, mode, arg)
-
     def step(self):
-        opcode = self._get_bytes()  # advances pc
-        instruction = self._prepare_instruction(*opcode)
-        self._execute(*instruction)
+        if self.cycles >= self._deadline:
+            self._service()
+        _dispatch[self.ram.read(self.PC)](self)
+
+    def run(self, cycles=None, until_pc=None, max_instructions=None,
+            until=None, brk=True):
+        # stops once the cycle budget is spent, before a BRK (if brk), after
+        # reaching until_pc, or once until(cpu) is true; reason is 'cycles',
+        # 'instructions', 'brk', 'pc' or 'until'. pending interrupts are
+        # taken and scheduled events fired between instructions; neither
+        # counts as an instruction.
+        dispatch, ram = _dispatch, self.ram
+        start = self.cycles
+        deadline = float('inf') if cycles is None else start + cycles
+        limit = -1 if max_instructions is None else max_instructions
+        stop_pc = -1 if until_pc is None else until_pc
+        stop_op = 0x00 if brk else -1
+        count, reason = 0, 'instructions'
+        self._arm(deadline)
+
+        while count != limit:
+            if self.cycles >= self._deadline:
+                if self.cycles >= deadline:
+                    reason = 'cycles'
+                    break
+                self._service()
+                continue
+            opcode = ram.read(self.PC)
+            if opcode == stop_op:
+                reason = 'brk'
+                break
+            dispatch[opcode](self)
+            count += 1
+            if self.PC == stop_pc:
+                reason = 'pc'
+                break
+            if until is not None and until(self):
+                reason = 'until'
+                break
+
+        return RunResult(count, self.cycles - start, reason)
+
+
+#
+# dispatch table. one handler per opcode with operand fetch, pc advance and
+# addressing fused in; built once at import.
+
+def _invalid(cpu):
+    print('invalid opcode! passing NOP...')
+    cpu.PC = (cpu.PC + 1) & 0xffff
+    cpu.cycles += 2
+
+
+def _compile(opcode):
+    if opcode not in instructions._instructions:
+        return _invalid
+
+    func = instructions.get_instruction(opcode)
+    mode = instructions.get_mode(opcode)
+    size = instructions.get_size(opcode)
+    cycles = instructions.get_cycles(opcode)
+    if instructions.has_page_penalty(opcode):
+        addr = C6502.paged_modes[mode]
+    else:
+        addr = C6502.addr_modes[mode]
+
+    if size == 1:
+        def handler(cpu):
+            cpu.PC = (cpu.PC + 1) & 0xffff
+            cpu.cycles += cycles
+            func(cpu, mode, None)
+    elif size == 2 and mode in ('imm', 'zpg'):  # operand is the address
+        def handler(cpu):
+            pc = cpu.PC
+            arg = cpu.ram.read((pc + 1) & 0xffff)
+            cpu.PC = (pc + 2) & 0xffff
+            cpu.cycles += cycles
+            func(cpu, mode, arg)
+    elif size == 2:
+        def handler(cpu):
+            pc = cpu.PC
+            arg = cpu.ram.read((pc + 1) & 0xffff)
+            cpu.PC = (pc + 2) & 0xffff
+            cpu.cycles += cycles
+            func(cpu, mode, addr(cpu, arg))
+    elif mode == 'abs':
+        def handler(cpu):
+            pc = cpu.PC
+            read = cpu.ram.read
+            arg = (read((pc + 2) & 0xffff) << 8) | read((pc + 1) & 0xffff)
+            cpu.PC = (pc + 3) & 0xffff
+            cpu.cycles += cycles
+            func(cpu, mode, arg)
+    else:
+        def handler(cpu):
+            pc = cpu.PC
+            read = cpu.ram.read
+            arg = (read((pc + 2) & 0xffff) << 8) | read((pc + 1) & 0xffff)
+            cpu.PC = (pc + 3) & 0xffff
+            cpu.cycles += cycles
+            func(cpu, mode, addr(cpu, arg))
+
+    return handler
+
+
+_dispatch = [_compile(opcode) for opcode in range(0x100)]
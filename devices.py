@@ -0,0 +1,323 @@
+#
+# peripherals for c6502, mapped onto memory.Memory pages: a 6522 VIA
+# (ports, two timers, interrupt flags) and a 6551 ACIA (serial, connected to
+# file-like objects). registers repeat through the page, as they do on
+# boards that decode only the low address lines.
+#
+# nothing here ticks per cycle. timer counters are worked out from
+# cpu.cycles when read, and underflows and serial bytes are events on the
+# cpu's scheduler.
+
+from scheduler import Scheduler
+
+
+# VIA interrupt flag / enable bits.
+CA2 = 0x01
+CA1 = 0x02
+SR = 0x04
+CB2 = 0x08
+CB1 = 0x10
+T2 = 0x20
+T1 = 0x40
+
+
+class VIA:
+    def __init__(self, cpu, page, source=0x2):
+        self.cpu = cpu
+        self.source = source  # bit this device holds the irq line with
+        self.scheduler = cpu.scheduler or Scheduler(cpu)
+
+        self.ora = self.orb = 0x0
+        self.ddra = self.ddrb = 0x0
+        self.pins_a = self.pins_b = 0xff  # input pins, driven from outside
+        self.on_output = None  # on_output(port, val), port 'a' or 'b'
+        self.sr = self.acr = self.pcr = 0x0
+        self.ifr = self.ier = 0x0
+
+        self.t1_latch = self.t2_latch = 0xffff
+        self._t1 = (0, 0xffff)  # (cycle the count was loaded, count)
+        self._t2 = (0, 0xffff)
+        self._t1_event = self._t2_event = None
+
+        cpu.ram.map(page, page, self.read, self.write)
+
+    #
+    # interrupt flags.
+
+    def _update(self):
+        if self.ifr & self.ier & 0x7f:
+            self.cpu.irq(self.source)
+        else:
+            self.cpu.release_irq(self.source)
+
+    def strobe(self, flags):
+        # an active edge on CA1/CA2/CB1/CB2 from outside.
+        self.ifr |= flags
+        self._update()
+
+    def _clear(self, flags):
+        if self.ifr & flags:
+            self.ifr &= ~flags
+            self._update()
+
+    #
+    # timers.
+
+    def _count(self, timer, free_run=False):
+        start, count = timer
+        elapsed = self.cpu.cycles - start
+        if free_run:  # count, ..., 0, $ffff, then reloads from the latch
+            return (count - elapsed % (count + 2)) & 0xffff
+        return (count - elapsed) & 0xffff
+
+    def _start_t1(self):
+        count, cycles = self.t1_latch, self.cpu.cycles
+        self._t1 = (cycles, count)
+        if self._t1_event is not None:
+            self.scheduler.cancel(self._t1_event)
+        self._t1_event = self.scheduler.at(cycles + count + 1,
+                                           self._t1_underflow)
+        self._clear(T1)
+
+    def _t1_underflow(self, cycle):
+        self._t1_event = None
+        self.ifr |= T1
+        self._update()
+        if self.acr & 0x40:  # free-run: reload and go again
+            count = self.t1_latch
+            self._t1 = (cycle + 1, count)
+            self._t1_event = self.scheduler.at(cycle + count + 2,
+                                               self._t1_underflow)
+
+    def _start_t2(self, count):
+        cycles = self.cpu.cycles
+        self._t2 = (cycles, count)
+        if self._t2_event is not None:
+            self.scheduler.cancel(self._t2_event)
+        if not self.acr & 0x20:  # pulse counting (PB6) is not emulated
+            self._t2_event = self.scheduler.at(cycles + count + 1,
+                                               self._t2_underflow)
+        self._clear(T2)
+
+    def _t2_underflow(self, cycle):
+        self._t2_event = None
+        self.ifr |= T2
+        self._update()
+
+    #
+    # bus.
+
+    def read(self, addr):
+        reg = addr & 0x0f
+        if reg == 0x0:
+            self._clear(CB1 | CB2)
+            return (self.orb & self.ddrb) | (self.pins_b & ~self.ddrb & 0xff)
+        if reg in (0x1, 0xf):
+            if reg == 0x1:
+                self._clear(CA1 | CA2)
+            return (self.ora & self.ddra) | (self.pins_a & ~self.ddra & 0xff)
+        if reg == 0x2:
+            return self.ddrb
+        if reg == 0x3:
+            return self.ddra
+        if reg == 0x4:
+            self._clear(T1)
+            return self._count(self._t1, self.acr & 0x40) & 0xff
+        if reg == 0x5:
+            return self._count(self._t1, self.acr & 0x40) >> 8
+        if reg == 0x6:
+            return self.t1_latch & 0xff
+        if reg == 0x7:
+            return self.t1_latch >> 8
+        if reg == 0x8:
+            self._clear(T2)
+            return self._count(self._t2) & 0xff
+        if reg == 0x9:
+            return self._count(self._t2) >> 8
+        if reg == 0xa:
+            self._clear(SR)
+            return self.sr
+        if reg == 0xb:
+            return self.acr
+        if reg == 0xc:
+            return self.pcr
+        if reg == 0xd:
+            return self.ifr | (0x80 if self.ifr & self.ier & 0x7f else 0x0)
+        return self.ier | 0x80
+
+    def write(self, addr, val):
+        reg = addr & 0x0f
+        if reg == 0x0:
+            self.orb = val
+            self._clear(CB1 | CB2)
+            if self.on_output is not None:
+                self.on_output('b', val & self.ddrb)
+        elif reg in (0x1, 0xf):
+            self.ora = val
+            if reg == 0x1:
+                self._clear(CA1 | CA2)
+            if self.on_output is not None:
+                self.on_output('a', val & self.ddra)
+        elif reg == 0x2:
+            self.ddrb = val
+        elif reg == 0x3:
+            self.ddra = val
+        elif reg in (0x4, 0x6):
+            self.t1_latch = (self.t1_latch & 0xff00) | val
+        elif reg == 0x5:
+            self.t1_latch = (self.t1_latch & 0xff) | (val << 8)
+            self._start_t1()
+        elif reg == 0x7:
+            self.t1_latch = (self.t1_latch & 0xff) | (val << 8)
+            self._clear(T1)
+        elif reg == 0x8:
+            self.t2_latch = (self.t2_latch & 0xff00) | val
+        elif reg == 0x9:
+            self._start_t2((self.t2_latch & 0xff) | (val << 8))
+        elif reg == 0xa:
+            self.sr = val
+            self._clear(SR)
+        elif reg == 0xb:
+            self.acr = val
+        elif reg == 0xc:
+            self.pcr = val
+        elif reg == 0xd:
+            self._clear(val & 0x7f)
+        elif val & 0x80:
+            self.ier |= val & 0x7f
+            self._update()
+        else:
+            self.ier &= ~val & 0x7f
+            self._update()
+
+
+#
+# 6551 ACIA.
+
+# baud rate by control register bits 0-3; 0 is the external 16x clock,
+# taken here as 115200.
+_bauds = (115200, 50, 75, 109.92, 134.58, 150, 300, 600, 1200, 1800, 2400,
+          3600, 4800, 7200, 9600, 19200)
+
+
+class ACIA:
+    def __init__(self, cpu, page, rx=None, tx=None, clock=1023000, paced=True,
+                 source=0x4):
+        # rx and tx are binary file-likes (files, pipes, sockets' makefile).
+        # rx.read(1) may return None when nothing is waiting (a non-blocking
+        # pipe) and b'' at the end. paced False drops the baud rate timing:
+        # the transmitter is always ready and a byte is received whenever
+        # the last one was read, for throughput tests.
+        self.cpu = cpu
+        self.rx, self.tx = rx, tx
+        self.clock = clock
+        self.paced = paced
+        self.source = source
+        self.scheduler = cpu.scheduler or Scheduler(cpu)
+
+        self.data = 0x0
+        self.status = 0x10  # transmitter empty
+        self.command = 0x02
+        self.control = 0x0
+        self._rx_event = None
+        self._eof = False
+
+        cpu.ram.map(page, page, self.read, self.write)
+
+    def byte_cycles(self):
+        # cpu cycles per character at the programmed rate and format.
+        bits = (1 + (8 - ((self.control >> 5) & 0x3)) +
+                (2 if self.control & 0x80 else 1))
+        return int(self.clock * bits / _bauds[self.control & 0x0f])
+
+    def _interrupt(self):
+        rx = not self.command & 0x02 and self.status & 0x08
+        tx = self.command & 0x0c == 0x04 and self.status & 0x10
+        if self.command & 0x01 and (rx or tx):
+            self.status |= 0x80
+            self.cpu.irq(self.source)
+
+    #
+    # receiving.
+
+    def _pull(self):
+        # loads the next byte from rx if the data register is free; False
+        # once rx is exhausted.
+        if self.rx is None or self._eof:
+            return False
+        if not self.status & 0x08:
+            byte = self.rx.read(1)
+            if byte == b'':
+                self._eof = True
+                return False
+            if byte:
+                self.data = byte[0]
+                self.status |= 0x08
+                self._interrupt()
+        return True
+
+    def _receive(self, cycle):
+        self._rx_event = None
+        if self._pull():
+            self._rx_event = self.scheduler.at(cycle + self.byte_cycles(),
+                                               self._receive)
+
+    def _listen(self):
+        if not self.command & 0x01:
+            return
+        if not self.paced:
+            self._pull()
+        elif self._rx_event is None:
+            self._rx_event = self.scheduler.after(self.byte_cycles(),
+                                                  self._receive)
+
+    #
+    # transmitting.
+
+    def _sent(self, cycle):
+        self.status |= 0x10
+        self._interrupt()
+
+    def flush(self):
+        if self.tx is not None:
+            self.tx.flush()
+
+    #
+    # bus.
+
+    def read(self, addr):
+        reg = addr & 0x03
+        if reg == 0x0:
+            val = self.data
+            self.status &= ~0x0c & 0xff  # received byte taken; overrun cleared
+            if not self.paced:
+                self._pull()
+            return val
+        if reg == 0x1:
+            if not self.paced:
+                self._pull()
+            val = self.status
+            self.status &= 0x7f
+            self.cpu.release_irq(self.source)
+            return val
+        if reg == 0x2:
+            return self.command
+        return self.control
+
+    def write(self, addr, val):
+        reg = addr & 0x03
+        if reg == 0x0:
+            if self.tx is not None:
+                self.tx.write(bytes((val,)))
+            if self.paced:
+                self.status &= ~0x10 & 0xff
+                self.scheduler.after(self.byte_cycles(), self._sent)
+        elif reg == 0x1:  # programmed reset
+            self.status &= ~0x04 & 0xff
+            self.command = (self.command & 0xe0) | 0x02
+        elif reg == 0x2:
+            self.command = val
+            self._listen()
+            self._interrupt()
+        else:
+            self.control = val
@@ -0,0 +1,106 @@
+#
+# table-driven disassembler for c6502. every opcode is turned into a
+# (size, operand kind, format) entry once, and ranges are decoded in one pass
+# over a copy of ram. decoded lines are cached per address and dropped by
+# write hooks (and bulk load listeners) when their bytes change.
+
+import instructions
+
+
+_none, _byte, _word, _rel = range(4)  # operand kinds
+
+
+def _table():
+    table = []
+    for opcode in range(0x100):
+        if opcode not in instructions._instructions:
+            table.append((1, _none, '.byte $%02x' % opcode))
+            continue
+        func, mode, cycles = instructions._instructions[opcode]
+        size = instructions._sizes[mode]
+        text = ('%s %s' % (func.__name__, instructions._formats[mode])).strip()
+        table.append((size, _rel if mode == 'rel' else size - 1, text))
+    return table
+
+
+_decode = _table()
+
+
+class Disassembler:
+    def __init__(self, ram):
+        self.ram = ram
+        self._lines = {}  # addr: (size, text)
+        self._hooked = bytearray(0x100)
+        ram.add_listener(self.invalidate)
+
+    def close(self):
+        for page in range(0x100):
+            if self._hooked[page]:
+                self.ram.remove_hook(page, self._on_write)
+        self._hooked = bytearray(0x100)
+        self.ram.remove_listener(self.invalidate)
+
+    #
+    # cache.
+
+    def _on_write(self, addr, val):
+        lines = self._lines
+        for start in (addr, addr - 1, addr - 2):  # lines that may cover addr
+            lines.pop(start & 0xffff, None)
+
+    def invalidate(self, start=0x0, end=0x10000):
+        lines = self._lines
+        if end - start > len(lines):
+            for addr in [a for a in lines if start - 2 <= a < end]:
+                del lines[addr]
+        else:
+            for addr in range(start - 2, end):
+                lines.pop(addr & 0xffff, None)
+
+    #
+    # decoding.
+
+    def lines(self, start, count=None, end=None):
+        # [(addr, size, text)], decoding from start for count lines or up to
+        # end (exclusive), whichever comes first; by default to $ffff.
+        image = self.ram.image()
+        image = bytes(image) + image[:2]  # operands may wrap past $ffff
+        lines, decode, hooked = self._lines, _decode, self._hooked
+        limit = -1 if count is None else count
+        end = 0x10000 if end is None else end
+        out, pages, addr = [], set(), start
+
+        while addr < end and len(out) != limit:
+            line = lines.get(addr)
+            if line is None:
+                size, kind, text = decode[image[addr]]
+                if kind == _byte:
+                    text %= image[addr + 1]
+                elif kind == _word:
+                    text %= image[addr + 1] | (image[addr + 2] << 8)
+                elif kind == _rel:
+                    offset = image[addr + 1]
+                    text %= (addr + 2 + offset - ((offset & 0x80) << 1)) & 0xffff
+                line = lines[addr] = (size, text)
+                pages.add(addr >> 8)
+                pages.add(((addr + size - 1) >> 8) & 0xff)
+            out.append((addr, line[0], line[1]))
+            addr += line[0]
+
+        for page in pages:
+            if not hooked[page]:
+                hooked[page] = 1
+                self.ram.add_hook(page, self._on_write)
+        return out
+
+    def decode(self, addr):
+        # (size, text) of the instruction at addr.
+        return self.lines(addr, 1)[0][1:]
+
+    def listing(self, start, count=None, end=None):
+        image = self.ram.image()
+        out = []
+        for addr, size, text in self.lines(start, count, end):
+            raw = ' '.join('%02x' % image[(addr + i) & 0xffff] for i in range(size))
+            out.append('0x%04x  %-8s  %s' % (addr, raw, text))
+        return '\n'.join(out)
@@ -0,0 +1,90 @@
+#
+# asyncio host for c6502. a Machine runs its engine in cycle-budgeted
+# slices, yields to the event loop between them and paces itself against
+# the loop clock, so one process can keep many machines at their emulated
+# speed without any of them starving the rest.
+
+import asyncio
+import inspect
+
+from c6502 import RunResult
+
+
+class Machine:
+    def __init__(self, cpu, hz=1023000, slice_cycles=None, engine=None,
+                 max_lag=0.25):
+        self.cpu = cpu
+        self.engine = cpu if engine is None else engine  # e.g. a Translator
+        self.hz = hz  # None runs unpaced, still yielding every slice
+        self.slice_cycles = slice_cycles or (hz // 100 if hz else 10000)
+        self.max_lag = max_lag  # seconds behind before the debt is dropped
+        self.callbacks = []  # callback(machine) after every slice; may be async
+        self.lag = 0.0  # seconds behind the target clock after the last slice
+        self._deferred = []
+        self._stopped = False
+
+    def add_callback(self, callback):
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    def defer(self, awaitable):
+        # for synchronous hooks and devices: awaited before the next slice.
+        self._deferred.append(awaitable)
+
+    def stop(self):
+        # ends run() after the current slice.
+        self._stopped = True
+
+    async def _service(self):
+        while self._deferred:
+            deferred, self._deferred = self._deferred, []
+            for awaitable in deferred:
+                await awaitable
+        for callback in list(self.callbacks):
+            result = callback(self)
+            if inspect.isawaitable(result):
+                await result
+
+    async def run(self, cycles=None, until_pc=None, until=None, brk=True):
+        # runs until the cycle budget is spent, stop() is called or the
+        # engine stops on its own; reason is 'cycles', 'stopped' or the
+        # engine's. sleeps aim at start + cycles / hz rather than adding up
+        # per-slice delays, so pacing does not drift.
+        loop = asyncio.get_running_loop()
+        cpu, engine = self.cpu, self.engine
+        start = cpu.cycles
+        end = float('inf') if cycles is None else start + cycles
+        base_time, base_cycles = loop.time(), start
+        count, reason = 0, 'cycles'
+        self._stopped = False
+
+        while cpu.cycles < end:
+            if self._stopped:
+                reason = 'stopped'
+                break
+            result = engine.run(cycles=min(self.slice_cycles, end - cpu.cycles),
+                                until_pc=until_pc, until=until, brk=brk)
+            count += result.instructions
+            await self._service()
+            if result.reason != 'cycles':
+                reason = result.reason
+                break
+
+            delay = 0.0
+            if self.hz:
+                delay = base_time + (cpu.cycles - base_cycles) / self.hz - loop.time()
+                if delay < -self.max_lag:  # too far behind to catch up
+                    base_time, base_cycles, delay = loop.time(), cpu.cycles, 0.0
+            self.lag = max(-delay, 0.0)
+            await asyncio.sleep(max(delay, 0.0))
+
+        return RunResult(count, cpu.cycles - start, reason)
+
+
+async def run_all(machines, **kwargs):
+    # runs every machine concurrently; returns their RunResults in order.
+    return await asyncio.gather(*(machine.run(**kwargs) for machine in machines))
@@ -7,7 +7,7 @@ _sizes = {  # mode: size (in bytes).
     'aby': 3,
     'imm': 2,
     'imp': 1,
-    'ind': 2,
+    'ind': 3,
     'iix': 2,
     'iiy': 2,
     'rel': 2,
@@ -19,158 +19,169 @@ _sizes = {  # mode: size (in bytes).
 #
 # main index.
 
-_instructions = {  # instruction byte: func, mode.
-    0x69: (ADC, 'imm'),  # ADC
-    0x65: (ADC, 'zpg'),
-    0x75: (ADC, 'zpx'),
-    0x6d: (ADC, 'abs'),
-    0x7d: (ADC, 'abx'),
-    0x79: (ADC, 'aby'),
-    0x61: (ADC, 'iix'),
-    0x71: (ADC, 'iiy'),
-    0x29: (AND, 'imm'),  # AND
-    0x25: (AND, 'zpg'),
-    0x35: (AND, 'zpx'),
-    0x2d: (AND, 'abs'),
-    0x3d: (AND, 'abx'),
-    0x39: (AND, 'aby'),
-    0x21: (AND, 'iix'),
-    0x31: (AND, 'iiy'),
-    0x0a: (ASL, 'acc'),  # ASL
-    0x06: (ASL, 'zpg'),
-    0x16: (ASL, 'zpx'),
-    0x0e: (ASL, 'abs'),
-    0x1e: (ASL, 'abx'),
-    0x90: (BCC, 'rel'),  # BCC
-    0xb0: (BCS, 'rel'),  # BCS
-    0xf0: (BEQ, 'rel'),  # BEQ
-    0x24: (BIT, 'zpg'),  # BIT
-    0x2c: (BIT, 'abs'),
-    0x30: (BMI, 'rel'),  # BMI
-    0xd0: (BNE, 'rel'),  # BNE
-    0x10: (BPL, 'rel'),  # BPL
-    0x00: (BRK, 'imp'),  # BRK
-    0x50: (BVC, 'rel'),  # BVC
-    0x18: (CLC, 'imp'),  # CLC
-    0xd8: (CLD, 'imp'),  # CLD
-    0x58: (CLI, 'imp'),  # CLI
-    0xb8: (CLV, 'imp'),  # CLV
-    0xc9: (CMP, 'imm'),  # CMP
-    0xc5: (CMP, 'zpg'),
-    0xd5: (CMP, 'zpx'),
-    0xcd: (CMP, 'abs'),
-    0xdd: (CMP, 'abx'),
-    0xd9: (CMP, 'aby'),
-    0xc1: (CMP, 'iix'),
-    0xd1: (CMP, 'iiy'),
-    0xe0: (CPX, 'imm'),  # CPX
-    0xe4: (CPX, 'zpg'),
-    0xec: (CPX, 'abs'),
-    0xc0: (CPY, 'imm'),  # CPY
-    0xc4: (CPY, 'zpg'),
-    0xcc: (CPY, 'abs'),
-    0xc6: (DEC, 'zpg'),  # DEC
-    0xd6: (DEC, 'zpx'),
-    0xce: (DEC, 'abs'),
-    0xde: (DEC, 'abx'),
-    0xca: (DEX, 'imp'),  # DEX
-    0x88: (DEY, 'imp'),  # DEY
-    0x49: (EOR, 'imm'),  # EOR
-    0x45: (EOR, 'zpg'),
-    0x55: (EOR, 'zpx'),
-    0x4d: (EOR, 'abs'),
-    0x5d: (EOR, 'abx'),
-    0x59: (EOR, 'aby'),
-    0x41: (EOR, 'iix'),
-    0x51: (EOR, 'iiy'),
-    0xe6: (INC, 'zpg'),  # INC
-    0xf6: (INC, 'zpx'),
-    0xee: (INC, 'abs'),
-    0xfe: (INC, 'abx'),
-    0xe8: (INX, 'imp'),  # INX
-    0xc8: (INY, 'imp'),  # INY
-    0x4c: (JMP, 'abs'),  # JMP
-    0x6c: (JMP, 'ind'),
-    0x20: (JSR, 'abs'),  # JSR
-    0xa9: (LDA, 'imm'),  # LDA
-    0xa5: (LDA, 'zpg'),
-    0xb5: (LDA, 'zpx'),
-    0xad: (LDA, 'abs'),
-    0xbd: (LDA, 'abx'),
-    0xb9: (LDA, 'aby'),
-    0xa1: (LDA, 'iix'),
-    0xb1: (LDA, 'iiy'),
-    0xa2: (LDX, 'imm'),  # LDX
-    0xa6: (LDX, 'zpg'),
-    0xb6: (LDX, 'zpy'),
-    0xae: (LDX, 'abs'),
-    0xbe: (LDX, 'aby'),
-    0xa0: (LDY, 'imm'),  # LDY
-    0xa4: (LDY, 'zpg'),
-    0xb4: (LDY, 'zpx'),
-    0xac: (LDY, 'abs'),
-    0xbc: (LDY, 'abx'),
-    0x4a: (LSR, 'acc'),  # LSR
-    0x46: (LSR, 'zpg'),
-    0x56: (LSR, 'zpx'),
-    0x4e: (LSR, 'abs'),
-    0x5e: (LSR, 'abx'),
-    0xea: (NOP, 'imp'),  # NOP
-    0x09: (ORA, 'imm'),  # ORA
-    0x05: (ORA, 'zpg'),
-    0x15: (ORA, 'zpx'),
-    0x0d: (ORA, 'abs'),
-    0x1d: (ORA, 'abx'),
-    0x19: (ORA, 'aby'),
-    0x01: (ORA, 'iix'),
-    0x11: (ORA, 'iiy'),
-    0x48: (PHA, 'imp'),  # PHA
-    0x28: (PHP, 'imp'),  # PHP
-    0x68: (PLA, 'imp'),  # PLA
-    0x2a: (ROL, 'acc'),  # ROL
-    0x26: (ROL, 'zpg'),
-    0x36: (ROL, 'zpx'),
-    0x2e: (ROL, 'abs'),
-    0x3e: (ROL, 'abx'),
-    0x6a: (ROR, 'acc'),  # ROR
-    0x66: (ROR, 'zpg'),
-    0x76: (ROR, 'zpx'),
-    0x6e: (ROR, 'abs'),
-    0x7e: (ROR, 'abx'),
-    0x40: (RTI, 'imp'),  # RTI
-    0x60: (RTS, 'imp'),  # RTS
-    0xe9: (SBC, 'imm'),  # SBC
-    0xe5: (SBC, 'zpg'),
-    0xf5: (SBC, 'zpx'),
-    0xed: (SBC, 'abs'),
-    0xfd: (SBC, 'abx'),
-    0xf9: (SBC, 'aby'),
-    0xe1: (SBC, 'iix'),
-    0xf1: (SBC, 'iiy'),
-    0x38: (SEC, 'imp'),  # SEC
-    0xf8: (SED, 'imp'),  # SED
-    0x78: (SEI, 'imp'),  # SEI
-    0x85: (STA, 'zpg'),  # STA
-    0x95: (STA, 'zpx'),
-    0x8d: (STA, 'abs'),
-    0x9d: (STA, 'abx'),
-    0x99: (STA, 'aby'),
-    0x81: (STA, 'iix'),
-    0x91: (STA, 'iiy'),
-    0x86: (STX, 'zpg'),  # STX
-    0x96: (STX, 'zpy'),
-    0x8e: (STX, 'abs'),
-    0x84: (STY, 'zpg'),  # STY
-    0x94: (STY, 'zpx'),
-    0x8c: (STY, 'abs'),
-    0xaa: (TAX, 'imp'),  # TAX
-    0xa8: (TAY, 'imp'),  # TAY
-    0xba: (TSX, 'imp'),  # TSZ
-    0x8a: (TXA, 'imp'),  # TXA
-    0x9a: (TXS, 'imp'),  # TXS
-    0x98: (TYA, 'imp'),  # TYA
+_instructions = {  # instruction byte: func, mode, base cycles.
+    0x69: (ADC, 'imm', 2),  # ADC
+    0x65: (ADC, 'zpg', 3),
+    0x75: (ADC, 'zpx', 4),
+    0x6d: (ADC, 'abs', 4),
+    0x7d: (ADC, 'abx', 4),
+    0x79: (ADC, 'aby', 4),
+    0x61: (ADC, 'iix', 6),
+    0x71: (ADC, 'iiy', 5),
+    0x29: (AND, 'imm', 2),  # AND
+    0x25: (AND, 'zpg', 3),
+    0x35: (AND, 'zpx', 4),
+    0x2d: (AND, 'abs', 4),
+    0x3d: (AND, 'abx', 4),
+    0x39: (AND, 'aby', 4),
+    0x21: (AND, 'iix', 6),
+    0x31: (AND, 'iiy', 5),
+    0x0a: (ASL, 'acc', 2),  # ASL
+    0x06: (ASL, 'zpg', 5),
+    0x16: (ASL, 'zpx', 6),
+    0x0e: (ASL, 'abs', 6),
+    0x1e: (ASL, 'abx', 7),
+    0x90: (BCC, 'rel', 2),  # BCC
+    0xb0: (BCS, 'rel', 2),  # BCS
+    0xf0: (BEQ, 'rel', 2),  # BEQ
+    0x24: (BIT, 'zpg', 3),  # BIT
+    0x2c: (BIT, 'abs', 4),
+    0x30: (BMI, 'rel', 2),  # BMI
+    0xd0: (BNE, 'rel', 2),  # BNE
+    0x10: (BPL, 'rel', 2),  # BPL
+    0x00: (BRK, 'imp', 7),  # BRK
+    0x50: (BVC, 'rel', 2),  # BVC
+    0x70: (BVS, 'rel', 2),  # BVS
+    0x18: (CLC, 'imp', 2),  # CLC
+    0xd8: (CLD, 'imp', 2),  # CLD
+    0x58: (CLI, 'imp', 2),  # CLI
+    0xb8: (CLV, 'imp', 2),  # CLV
+    0xc9: (CMP, 'imm', 2),  # CMP
+    0xc5: (CMP, 'zpg', 3),
+    0xd5: (CMP, 'zpx', 4),
+    0xcd: (CMP, 'abs', 4),
+    0xdd: (CMP, 'abx', 4),
+    0xd9: (CMP, 'aby', 4),
+    0xc1: (CMP, 'iix', 6),
+    0xd1: (CMP, 'iiy', 5),
+    0xe0: (CPX, 'imm', 2),  # CPX
+    0xe4: (CPX, 'zpg', 3),
+    0xec: (CPX, 'abs', 4),
+    0xc0: (CPY, 'imm', 2),  # CPY
+    0xc4: (CPY, 'zpg', 3),
+    0xcc: (CPY, 'abs', 4),
+    0xc6: (DEC, 'zpg', 5),  # DEC
+    0xd6: (DEC, 'zpx', 6),
+    0xce: (DEC, 'abs', 6),
+    0xde: (DEC, 'abx', 7),
+    0xca: (DEX, 'imp', 2),  # DEX
+    0x88: (DEY, 'imp', 2),  # DEY
+    0x49: (EOR, 'imm', 2),  # EOR
+    0x45: (EOR, 'zpg', 3),
+    0x55: (EOR, 'zpx', 4),
+    0x4d: (EOR, 'abs', 4),
+    0x5d: (EOR, 'abx', 4),
+    0x59: (EOR, 'aby', 4),
+    0x41: (EOR, 'iix', 6),
+    0x51: (EOR, 'iiy', 5),
+    0xe6: (INC, 'zpg', 5),  # INC
+    0xf6: (INC, 'zpx', 6),
+    0xee: (INC, 'abs', 6),
+    0xfe: (INC, 'abx', 7),
+    0xe8: (INX, 'imp', 2),  # INX
+    0xc8: (INY, 'imp', 2),  # INY
+    0x4c: (JMP, 'abs', 3),  # JMP
+    0x6c: (JMP, 'ind', 5),
+    0x20: (JSR, 'abs', 6),  # JSR
+    0xa9: (LDA, 'imm', 2),  # LDA
+    0xa5: (LDA, 'zpg', 3),
+    0xb5: (LDA, 'zpx', 4),
+    0xad: (LDA, 'abs', 4),
+    0xbd: (LDA, 'abx', 4),
+    0xb9: (LDA, 'aby', 4),
+    0xa1: (LDA, 'iix', 6),
+    0xb1: (LDA, 'iiy', 5),
+    0xa2: (LDX, 'imm', 2),  # LDX
+    0xa6: (LDX, 'zpg', 3),
+    0xb6: (LDX, 'zpy', 4),
+    0xae: (LDX, 'abs', 4),
+    0xbe: (LDX, 'aby', 4),
+    0xa0: (LDY, 'imm', 2),  # LDY
+    0xa4: (LDY, 'zpg', 3),
+    0xb4: (LDY, 'zpx', 4),
+    0xac: (LDY, 'abs', 4),
+    0xbc: (LDY, 'abx', 4),
+    0x4a: (LSR, 'acc', 2),  # LSR
+    0x46: (LSR, 'zpg', 5),
+    0x56: (LSR, 'zpx', 6),
+    0x4e: (LSR, 'abs', 6),
+    0x5e: (LSR, 'abx', 7),
+    0xea: (NOP, 'imp', 2),  # NOP
+    0x09: (ORA, 'imm', 2),  # ORA
+    0x05: (ORA, 'zpg', 3),
+    0x15: (ORA, 'zpx', 4),
+    0x0d: (ORA, 'abs', 4),
+    0x1d: (ORA, 'abx', 4),
+    0x19: (ORA, 'aby', 4),
+    0x01: (ORA, 'iix', 6),
+    0x11: (ORA, 'iiy', 5),
+    0x48: (PHA, 'imp', 3),  # PHA
+    0x08: (PHP, 'imp', 3),  # PHP
+    0x68: (PLA, 'imp', 4),  # PLA
+    0x28: (PLP, 'imp', 4),  # PLP
+    0x2a: (ROL, 'acc', 2),  # ROL
+    0x26: (ROL, 'zpg', 5),
+    0x36: (ROL, 'zpx', 6),
+    0x2e: (ROL, 'abs', 6),
+    0x3e: (ROL, 'abx', 7),
+    0x6a: (ROR, 'acc', 2),  # ROR
+    0x66: (ROR, 'zpg', 5),
+    0x76: (ROR, 'zpx', 6),
+    0x6e: (ROR, 'abs', 6),
+    0x7e: (ROR, 'abx', 7),
+    0x40: (RTI, 'imp', 6),  # RTI
+    0x60: (RTS, 'imp', 6),  # RTS
+    0xe9: (SBC, 'imm', 2),  # SBC
+    0xe5: (SBC, 'zpg', 3),
+    0xf5: (SBC, 'zpx', 4),
+    0xed: (SBC, 'abs', 4),
+    0xfd: (SBC, 'abx', 4),
+    0xf9: (SBC, 'aby', 4),
+    0xe1: (SBC, 'iix', 6),
+    0xf1: (SBC, 'iiy', 5),
+    0x38: (SEC, 'imp', 2),  # SEC
+    0xf8: (SED, 'imp', 2),  # SED
+    0x78: (SEI, 'imp', 2),  # SEI
+    0x85: (STA, 'zpg', 3),  # STA
+    0x95: (STA, 'zpx', 4),
+    0x8d: (STA, 'abs', 4),
+    0x9d: (STA, 'abx', 5),
+    0x99: (STA, 'aby', 5),
+    0x81: (STA, 'iix', 6),
+    0x91: (STA, 'iiy', 6),
+    0x86: (STX, 'zpg', 3),  # STX
+    0x96: (STX, 'zpy', 4),
+    0x8e: (STX, 'abs', 4),
+    0x84: (STY, 'zpg', 3),  # STY
+    0x94: (STY, 'zpx', 4),
+    0x8c: (STY, 'abs', 4),
+    0xaa: (TAX, 'imp', 2),  # TAX
+    0xa8: (TAY, 'imp', 2),  # TAY
+    0xba: (TSX, 'imp', 2),  # TSX
+    0x8a: (TXA, 'imp', 2),  # TXA
+    0x9a: (TXS, 'imp', 2),  # TXS
+    0x98: (TYA, 'imp', 2),  # TYA
 }
 
+#
+# reads through abx/aby/iiy take one more cycle when indexing crosses a page;
+# stores and read-modify-write ops always pay it, so it is in their base count.
+
+_page_penalty = frozenset(
+    opcode for opcode, (func, mode, cycles) in _instructions.items()
+    if mode in ('abx', 'aby', 'iiy') and
+    func in (ADC, AND, CMP, EOR, LDA, LDX, LDY, ORA, SBC))
+
 
 def get_instruction(opcode):
     return _instructions[opcode][0]
@@ -182,3 +193,34 @@ def get_mode(opcode):
 
 def get_size(opcode):
     return _sizes[_instructions[opcode][1]]
+
+
+def get_cycles(opcode):
+    return _instructions[opcode][2]
+
+
+def has_page_penalty(opcode):
+    return opcode in _page_penalty
+
+
+#
+# text form; pc is the instruction's own address (for 'rel' targets).
+
+_formats = {
+    'acc': 'A', 'abs': '$%04x', 'abx': '$%04x,X', 'aby': '$%04x,Y',
+    'imm': '#$%02x', 'imp': '', 'ind': '($%04x)', 'iix': '($%02x,X)',
+    'iiy': '($%02x),Y', 'rel': '$%04x', 'zpg': '$%02x', 'zpx': '$%02x,X',
+    'zpy': '$%02x,Y'
+}
+
+
+def disassemble(opcode, arg=None, pc=0x0):
+    if opcode not in _instructions:
+        return '.byte $%02x' % opcode
+    func, mode, cycles = _instructions[opcode]
+    fmt = _formats[mode]
+    if mode == 'rel':
+        arg = (pc + 2 + (arg - 0x100 if arg & 0x80 else arg)) & 0xffff
+    if '%' in fmt:
+        return '%s %s' % (func.__name__, fmt % arg)
+    return ('%s %s' % (func.__name__, fmt)).strip()
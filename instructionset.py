@@ -1,243 +1,292 @@
 #
 # c6502.py addressing mode functions always return an absolute address or a literal;
 # 'imm' or 'acc' passed as mode results in the appropriate treatment.
+#
+# status is packed in cpu.P: N V - B D I Z C, high to low.
+
+from array import array
+from operator import itemgetter
+
+_nz = bytes((val & 0x80) | (0x02 if not val else 0x0) for val in range(0x100))
+
+
+#
+# ADC/SBC results as (nvzc << 8) | a, looked up by
+# (decimal << 17) | (carry << 16) | (a << 8) | operand. decimal mode follows
+# the nmos parts: the accumulator and carry are bcd-adjusted, N and V come
+# from the high nibble sum before adjusting (ADC) or from the binary
+# result (SBC), and Z always from the binary result.
+
+def _arithmetic():
+    sums = [((_nz[s & 0xff] | (s >> 8)) << 8) | (s & 0xff) for s in range(0x200)]
+    over = [s | 0x4000 for s in sums]
+
+    # decimal ADC by k * 0x200 + high nibbles + adjusted low nibble sum,
+    # k being how many of the two high nibbles are negative; SBC results by
+    # high nibble difference + adjusted low difference + 0x200.
+    adjusted = []
+    for k in range(3):
+        for s in range(0x200):
+            signed = s - (k << 8)
+            hi = s + 0x60 if s >= 0xa0 else s
+            flags = ((s & 0x80) | (0x0 if -0x80 <= signed <= 0x7f else 0x40) |
+                     (hi >= 0x100))
+            adjusted.append((flags << 8) | (hi & 0xff))
+    borrowed = [(v - 0x60 if v < 0 else v) & 0xff for v in range(-0x200, 0x200)]
+
+    # binary rows are slices of the sums, V set where the operand signs
+    # match and the result's differs; SBC adds the operand's complement,
+    # which is the ADC row reversed.
+    binary, adc, sbc = [], array('H'), array('H')
+    for c in (0, 1):
+        for a in range(0x100):
+            s = a + c
+            if a < 0x80:
+                lo, hi = max(0x0, 0x80 - s), 0x80
+            else:
+                lo, hi = 0x80, max(0x80, 0x180 - s)
+            binary.append(sums[s:s + lo] + over[s + lo:s + hi] +
+                          sums[s + hi:s + 0x100])
+    for row in binary:
+        adc.extend(row)
+    for row in binary:
+        sbc.extend(row[::-1])
+
+    for c in (0, 1):
+        for a in range(0x100):
+            x = a & 0xf0
+            lows, diffs = [], []
+            for ml in range(0x10):
+                lo = (a & 0x0f) + ml + c
+                lows.append(((lo + 0x06) & 0x0f) + 0x10 if lo >= 0x0a else lo)
+                lo = (a & 0x0f) - ml + c - 1
+                diffs.append((((lo - 0x06) & 0x0f) - 0x10 if lo < 0 else lo) + 0x20)
+            lows, diffs = itemgetter(*lows), itemgetter(*diffs)
+
+            row, vals = [], []
+            for mh in range(0x0, 0x100, 0x10):
+                base = ((x >> 7) + (mh >> 7)) * 0x200 + x + mh
+                row.extend(lows(adjusted[base:base + 0x20]))
+                base = 0x200 + x - mh - 0x20
+                vals.extend(diffs(borrowed[base:base + 0x40]))
+            row[(-a - c) & 0xff] |= 0x0200
+            adc.extend(row)
+            flags = binary[(c << 8) | a][::-1]
+            sbc.extend([(f & 0xff00) | v for f, v in zip(flags, vals)])
+
+    return adc, sbc
+
+
+_adc, _sbc = _arithmetic()
 
 
 def ADC(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    val = cpu.acc() + mem + cpu.c()
-    cpu.v(True if val > 0xff else False)
-    cpu.n(val >> 7)
-    if cpu.d():
-        pass
-    else:
-        cpu.c(val > 0xff)
-    cpu.acc(val)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    p = cpu.P
+    val = _adc[((p & 0x08) << 14) | ((p & 0x01) << 16) | (cpu.A << 8) | mem]
+    cpu.A = val & 0xff
+    cpu.P = (p & 0x3c) | (val >> 8)
 
 
 def AND(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    val = mem & cpu.acc()
-    cpu.acc(val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    val = mem & cpu.A
+    cpu.A = val
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def ASL(cpu, mode, op):
-    mem = cpu.acc() if mode == 'acc' else cpu.ram(op)
-    val = (mem << 1) & 0xfe
-    cpu.acc(val) if mode == 'acc' else cpu.ram(op, val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
-    cpu.c(mem >> 7)
+    mem = cpu.A if mode == 'acc' else cpu.ram.read(op)
+    val = (mem << 1) & 0xff
+    if mode == 'acc':
+        cpu.A = val
+    else:
+        cpu.ram.write(op, val)
+    cpu.P = (cpu.P & 0x7c) | _nz[val] | (mem >> 7)
+
+
+#
+# branches; 'rel' addressing has already resolved op to the target. a taken
+# branch costs one more cycle, two if it lands on another page.
+
+def _branch(cpu, op):
+    cpu.cycles += 2 if (cpu.PC ^ op) & 0xff00 else 1
+    cpu.PC = op
 
 
 def BCC(cpu, mode, op):
-    if not cpu.c():
-        cur_pc = cpu.pc()
-        mem = (cur_pc + op) % 0x10000
-        JMP(cpu, 'imm', mem)
+    if not cpu.P & 0x01:
+        _branch(cpu, op)
 
 
 def BCS(cpu, mode, op):
-    if cpu.c():
-        cur_pc = cpu.pc()
-        mem = (cur_pc + op) % 0x10000
-        JMP(cpu, 'imm', mem)
+    if cpu.P & 0x01:
+        _branch(cpu, op)
 
 
 def BEQ(cpu, mode, op):
-    if cpu.z():
-        mem = op
-        JMP(cpu, 'imm', mem)
+    if cpu.P & 0x02:
+        _branch(cpu, op)
 
 
 def BIT(cpu, mode, op):
-    mem = cpu.ram(op)
-    val = cpu.acc() & mem
-    cpu.n(val >> 7)
-    cpu.z(not val)
-    cpu.v((val >> 6) & 0x1)
+    mem = cpu.ram.read(op)
+    p = (cpu.P & 0x3d) | (mem & 0xc0)
+    if not cpu.A & mem:
+        p |= 0x02
+    cpu.P = p
 
 
 def BMI(cpu, mode, op):
-    if cpu.n():
-        cur_pc = cpu.pc()
-        mem = (cur_pc + op) % 0x10000
-        JMP(cpu, 'imm', mem)
+    if cpu.P & 0x80:
+        _branch(cpu, op)
 
 
 def BNE(cpu, mode, op):
-    if not cpu.z():
-        cur_pc = cpu.pc()
-        mem = (cur_pc + op) % 0x10000
-        JMP(cpu, 'imm', mem)
+    if not cpu.P & 0x02:
+        _branch(cpu, op)
 
 
 def BPL(cpu, mode, op):
-    if not cpu.n():
-        cur_pc = cpu.pc()
-        mem = (cur_pc + op) % 0x10000
-        JMP(cpu, 'imm', mem)
+    if not cpu.P & 0x80:
+        _branch(cpu, op)
 
 
 def BRK(cpu, mode, op):
-    cpu.push(cpu.pc() >> 8)
-    cpu.push(cpu.pc() & 0xff)
-    cpu.push(cpu.p() | 0x10)
-    cpu.pc((cpu.ram(0xffff) << 8) | cpu.ram(0xfffe))
+    pc = (cpu.PC + 1) & 0xffff  # skips the padding byte
+    cpu.push(pc >> 8)
+    cpu.push(pc & 0xff)
+    cpu.push(cpu.P | 0x30)
+    cpu.P |= 0x04
+    cpu.PC = (cpu.ram.read(0xffff) << 8) | cpu.ram.read(0xfffe)
 
 
 def BVC(cpu, mode, op):
-    if not cpu.v():
-        cur_pc = cpu.pc()
-        mem = (cur_pc + op) % 0x10000
-        JMP(cpu, 'imm', mem)
+    if not cpu.P & 0x40:
+        _branch(cpu, op)
 
 
 def BVS(cpu, mode, op):
-    if cpu.v():
-        cur_pc = cpu.pc()
-        mem = (cur_pc + op) % 0x10000
-        JMP(cpu, 'imm', mem)
+    if cpu.P & 0x40:
+        _branch(cpu, op)
 
 
 def CLC(cpu, mode, op):
-    cpu.c(False)
+    cpu.P &= 0xfe
 
 
 def CLD(cpu, mode, op):
-    cpu.d(False)
+    cpu.P &= 0xf7
 
 
 def CLI(cpu, mode, op):
-    cpu.i(False)
+    cpu.P &= 0xfb
+    if cpu.pending:
+        cpu._deadline = 0  # a held irq can be taken now
 
 
 def CLV(cpu, mode, op):
-    cpu.v(False)
+    cpu.P &= 0xbf
 
 
 def CMP(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    val = (cpu.acc() - mem) % 0x100
-    cpu.n(val >> 7)
-    cpu.z(not val)
-    cpu.c(cpu.acc() >= mem)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    val = (cpu.A - mem) & 0xff
+    cpu.P = (cpu.P & 0x7c) | _nz[val] | (cpu.A >= mem)
 
 
 def CPX(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    val = (cpu.x() - mem()) % 0x100
-    cpu.n(val >> 7)
-    cpu.z(not val)
-    cpu.c(cpu.x() >= mem)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    val = (cpu.X - mem) & 0xff
+    cpu.P = (cpu.P & 0x7c) | _nz[val] | (cpu.X >= mem)
 
 
 def CPY(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    val = (cpu.y() - mem) % 0x100
-    cpu.n(val >> 7)
-    cpu.z(not val)
-    cpu.c(cpu.y() >= mem)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    val = (cpu.Y - mem) & 0xff
+    cpu.P = (cpu.P & 0x7c) | _nz[val] | (cpu.Y >= mem)
 
 
 def DEC(cpu, mode, op):
-    mem = cpu.ram(op)
-    val = (mem - 1) % 0x100
-    cpu.ram(op, val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    val = (cpu.ram.read(op) - 1) & 0xff
+    cpu.ram.write(op, val)
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def DEX(cpu, mode, op):
-    val = (cpu.x() - 1) % 0x100
-    cpu.x(val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    val = (cpu.X - 1) & 0xff
+    cpu.X = val
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def DEY(cpu, mode, op):
-    val = (cpu.y() - 1) % 0x100
-    cpu.y(val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    val = (cpu.Y - 1) & 0xff
+    cpu.Y = val
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def EOR(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    val = cpu.acc() ^ mem
-    cpu.acc(val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    val = cpu.A ^ mem
+    cpu.A = val
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def INC(cpu, mode, op):
-    mem = cpu.ram(op)
-    val = (mem + 1) % 0x100
-    cpu.ram(op, val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    val = (cpu.ram.read(op) + 1) & 0xff
+    cpu.ram.write(op, val)
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def INX(cpu, mode, op):
-    val = cpu.x() + 1
-    cpu.x(val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    val = (cpu.X + 1) & 0xff
+    cpu.X = val
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def INY(cpu, mode, op):
-    val = cpu.y() + 1
-    cpu.y(val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    val = (cpu.Y + 1) & 0xff
+    cpu.Y = val
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def JMP(cpu, mode, op):
-    cpu.pc(op)
+    cpu.PC = op
 
 
 def JSR(cpu, mode, op):
-    mem = (cpu.pc() + 2) % 0x10000
-    meml, memh = mem & 0xff, mem << 8 & 0xff00
-    cpu.push(memh)
-    cpu.push(meml)
-    val = cpu.ram(op)
-    cpu.pc(val)
+    mem = (cpu.PC - 1) & 0xffff  # last byte of the JSR itself
+    cpu.push(mem >> 8)
+    cpu.push(mem & 0xff)
+    cpu.PC = op
 
 
 def LDA(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    cpu.acc(mem)
-    cpu.n(mem >> 7)
-    cpu.z(not mem)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    cpu.A = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def LDX(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    cpu.x(mem)
-    cpu.n(mem >> 7)
-    cpu.z(not mem)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    cpu.X = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def LDY(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    cpu.y(mem)
-    cpu.n(mem >> 7)
-    cpu.z(not mem)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    cpu.Y = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def LSR(cpu, mode, op):
-    mem = cpu.ram(op) if mode != 'acc' else cpu.acc()
-    cpu.n(False)
-    cpu.c(mem & 0x1)
+    mem = cpu.ram.read(op) if mode != 'acc' else cpu.A
     val = mem >> 1
-    cpu.z(not val)
+    cpu.P = (cpu.P & 0x7c) | _nz[val] | (mem & 0x1)
     if mode != 'acc':
-        cpu.ram(op, val)
+        cpu.ram.write(op, val)
     else:
-        cpu.acc(val)
+        cpu.A = val
 
 
 def NOP(cpu, mode, op):
@@ -245,144 +294,130 @@ def NOP(cpu, mode, op):
 
 
 def ORA(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    val = cpu.acc() | mem
-    cpu.acc(val)
-    cpu.n(val >> 7)
-    cpu.z(not val)
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    val = cpu.A | mem
+    cpu.A = val
+    cpu.P = (cpu.P & 0x7d) | _nz[val]
 
 
 def PHA(cpu, mode, op):
-    cpu.push(cpu.acc())
+    cpu.push(cpu.A)
 
 
 def PHP(cpu, mode, op):
-    cpu.push(cpu.p())
+    cpu.push(cpu.P | 0x30)
 
 
 def PLA(cpu, mode, op):
     mem = cpu.pull()
-    cpu.acc(mem)
-    cpu.n(mem >> 7)
-    cpu.z(not mem)
+    cpu.A = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def PLP(cpu, mode, op):
-    mem = cpu.pull()
-    cpu.p(mem)
+    cpu.P = (cpu.pull() & 0xef) | 0x20
+    if cpu.pending:
+        cpu._deadline = 0
 
 
 def ROL(cpu, mode, op):
-    mem = cpu.acc() if mode == 'acc' else cpu.ram(op)
+    mem = cpu.A if mode == 'acc' else cpu.ram.read(op)
     val = mem >> 7
-    mem = (mem << 1) | cpu.c()
+    mem = ((mem << 1) & 0xff) | (cpu.P & 0x01)
     if mode == 'acc':
-        cpu.acc(mem)
+        cpu.A = mem
     else:
-        cpu.ram(op, mem)
-    cpu.c(val)
-    cpu.z(not mem)
-    cpu.n(mem >> 7)
+        cpu.ram.write(op, mem)
+    cpu.P = (cpu.P & 0x7c) | _nz[mem] | val
 
 
 def ROR(cpu, mode, op):
-    mem = cpu.acc() if mode == 'acc' else cpu.ram(op)
+    mem = cpu.A if mode == 'acc' else cpu.ram.read(op)
     val = mem & 0x1
-    mem = (mem >> 1) | cpu.c()
+    mem = (mem >> 1) | ((cpu.P & 0x01) << 7)
     if mode == 'acc':
-        cpu.acc(mem)
+        cpu.A = mem
     else:
-        cpu.ram(op, mem)
-    cpu.c(val)
-    cpu.z(not mem)
-    cpu.n(mem >> 7)
+        cpu.ram.write(op, mem)
+    cpu.P = (cpu.P & 0x7c) | _nz[mem] | val
 
 
 def RTI(cpu, mode, op):
-    cpu.p(cpu.pull())
+    cpu.P = (cpu.pull() & 0xef) | 0x20
     lo = cpu.pull()
     hi = cpu.pull()
-    cpu.pc((hi << 8) | lo)
+    cpu.PC = (hi << 8) | lo
+    if cpu.pending:
+        cpu._deadline = 0
 
 
 def RTS(cpu, mode, op):
     meml = cpu.pull()
     memh = cpu.pull()
-    mem = (memh << 8) | meml
-    cpu.pc(mem)
+    cpu.PC = (((memh << 8) | meml) + 1) & 0xffff
 
 
 def SBC(cpu, mode, op):
-    mem = op if mode == 'imm' else cpu.ram(op)
-    if cpu.d():
-        pass
-    else:
-        val = cpu.acc() - mem - (not cpu.c())
-        cpu.v((val > 127) or (val < -128))
+    mem = op if mode == 'imm' else cpu.ram.read(op)
+    p = cpu.P
+    val = _sbc[((p & 0x08) << 14) | ((p & 0x01) << 16) | (cpu.A << 8) | mem]
+    cpu.A = val & 0xff
+    cpu.P = (p & 0x3c) | (val >> 8)
 
 
 def SEC(cpu, mode, op):
-    cpu.c(True)
+    cpu.P |= 0x01
 
 
 def SED(cpu, mode, op):
-    cpu.d(True)
+    cpu.P |= 0x08
 
 
 def SEI(cpu, mode, op):
-    cpu.i(True)
+    cpu.P |= 0x04
 
 
 def STA(cpu, mode, op):
-    mem = cpu.acc()
-    cpu.ram(op, mem)
+    cpu.ram.write(op, cpu.A)
 
 
 def STX(cpu, mode, op):
-    mem = cpu.x()
-    cpu.ram(op, mem)
+    cpu.ram.write(op, cpu.X)
 
 
 def STY(cpu, mode, op):
-    mem = cpu.y()
-    cpu.ram(op, mem)
+    cpu.ram.write(op, cpu.Y)
 
 
 def TAX(cpu, mode, op):
-    mem = cpu.acc()
-    cpu.x(mem)
-    cpu.n(mem << 7)
-    cpu.z(not mem)
+    mem = cpu.A
+    cpu.X = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def TAY(cpu, mode, op):
-    mem = cpu.acc()
-    cpu.y(mem)
-    cpu.n(mem << 7)
-    cpu.z(not mem)
+    mem = cpu.A
+    cpu.Y = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def TSX(cpu, mode, op):
-    mem = cpu.sp()
-    cpu.x(mem)
-    cpu.n(mem << 7)
-    cpu.z(not mem)
+    mem = cpu.SP
+    cpu.X = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def TXA(cpu, mode, op):
-    mem = cpu.x()
-    cpu.acc(mem)
-    cpu.n(mem << 7)
-    cpu.z(not mem)
+    mem = cpu.X
+    cpu.A = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
 
 
 def TXS(cpu, mode, op):
-    mem = cpu.x()
-    cpu.sp(mem)
+    cpu.SP = cpu.X
 
 
 def TYA(cpu, mode, op):
-    mem = cpu.y()
-    cpu.acc(mem)
-    cpu.n(mem << 7)
-    cpu.z(not mem)
+    mem = cpu.Y
+    cpu.A = mem
+    cpu.P = (cpu.P & 0x7d) | _nz[mem]
@@ -0,0 +1,144 @@
+#
+# image loading for c6502: raw binaries, intel hex and prg (2-byte load
+# address header). data goes into ram with one buffer copy per segment.
+
+import mmap
+import os
+
+
+_vectors = {'nmi': 0xfffa, 'reset': 0xfffc, 'irq': 0xfffe}
+
+
+def set_vectors(ram, reset=None, irq=None, nmi=None):
+    for name, addr in (('nmi', nmi), ('reset', reset), ('irq', irq)):
+        if addr is not None:
+            ram.load(_vectors[name], bytes((addr & 0xff, (addr >> 8) & 0xff)))
+
+
+#
+# formats. each parser returns a list of (addr, data) segments and the entry
+# point, if the format has one.
+
+def parse_raw(data, addr):
+    return [(addr, data)], None
+
+
+def parse_prg(data):
+    if len(data) < 2:
+        raise ValueError('prg image has no load address')
+    view = memoryview(data)
+    return [(view[0] | (view[1] << 8), view[2:])], None
+
+
+def parse_ihex(text):
+    if isinstance(text, (bytes, bytearray, memoryview)):
+        text = bytes(text).decode('ascii')
+
+    segments, entry = [], None
+    base, seg_addr, seg = 0, None, None
+
+    for num, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] != ':':
+            raise ValueError('line %d: missing record mark' % num)
+        record = bytes.fromhex(line[1:])
+        if len(record) < 5 or len(record) != record[0] + 5:
+            raise ValueError('line %d: bad record length' % num)
+        if sum(record) & 0xff:
+            raise ValueError('line %d: bad checksum' % num)
+
+        count, kind = record[0], record[3]
+        addr = base + ((record[1] << 8) | record[2])
+        payload = record[4:4 + count]
+
+        if kind == 0x00:  # data
+            if addr + count > 0x10000:
+                raise ValueError('line %d: data past 0xffff' % num)
+            if seg is not None and seg_addr + len(seg) == addr:
+                seg += payload
+            else:
+                if seg is not None:
+                    segments.append((seg_addr, seg))
+                seg_addr, seg = addr, bytearray(payload)
+        elif kind == 0x01:  # end of file
+            break
+        elif kind == 0x02:  # extended segment address
+            base = ((payload[0] << 8) | payload[1]) << 4
+        elif kind == 0x04:  # extended linear address
+            base = ((payload[0] << 8) | payload[1]) << 16
+        elif kind == 0x03:  # start segment address (cs:ip)
+            entry = ((((payload[0] << 8) | payload[1]) << 4) +
+                     ((payload[2] << 8) | payload[3])) & 0xffff
+        elif kind == 0x05:  # start linear address
+            entry = ((payload[2] << 8) | payload[3])
+        else:
+            raise ValueError('line %d: unknown record type %d' % (num, kind))
+
+    if seg is not None:
+        segments.append((seg_addr, seg))
+
+    return segments, entry
+
+
+#
+# loading.
+
+def load_image(cpu, data, addr=None, fmt='raw', reset=None, irq=None,
+               nmi=None):
+    # returns the (start, end) range covered and the reset vector written.
+    if fmt == 'raw':
+        segments, entry = parse_raw(data, 0x0 if addr is None else addr)
+    elif fmt == 'prg':
+        segments, entry = parse_prg(data)
+    elif fmt == 'ihex':
+        segments, entry = parse_ihex(data)
+    else:
+        raise ValueError('unknown image format %r' % fmt)
+
+    if fmt != 'raw' and addr is not None and segments:  # relocate
+        shift = addr - segments[0][0]
+        segments = [(start + shift, seg) for start, seg in segments]
+        if entry is not None:
+            entry = (entry + shift) & 0xffff
+
+    start, end = 0x10000, 0x0
+    for seg_addr, seg in segments:
+        start = min(start, seg_addr)
+        end = max(end, cpu.ram.load(seg_addr, seg))
+
+    if reset is None:
+        reset = entry
+    set_vectors(cpu.ram, reset, irq, nmi)
+
+    return (start, end), reset
+
+
+def guess_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.hex', '.ihx', '.ihex'):
+        return 'ihex'
+    if ext == '.prg':
+        return 'prg'
+    return 'raw'
+
+
+def load_file(cpu, path, addr=None, fmt=None, reset=None, irq=None, nmi=None):
+    # binary images are mapped rather than read, so large rom sets are
+    # copied straight from the page cache into ram.
+    fmt = guess_format(path) if fmt is None else fmt
+
+    if fmt == 'ihex':
+        with open(path) as f:
+            return load_image(cpu, f.read(), addr, fmt, reset, irq, nmi)
+
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return load_image(cpu, b'', addr, fmt, reset, irq, nmi)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return load_image(cpu, view, addr, fmt, reset, irq, nmi)
+            finally:
+                view.release()
@@ -28,11 +28,218 @@ class Flag:
 
 
 class Memory:
-    def __init__(self):
-        self._ram = [0] * 0x10000
+    def __init__(self, pages=None):
+        # flat: one bytearray. shared: _pages holds 256 pages, immutable bytes
+        # while shared with other Memory objects and a private bytearray once
+        # written (copy-on-write).
+        self._ram = bytearray(0x10000) if pages is None else None
+        self._pages = None if pages is None else list(pages)
+        self._hooks = [()] * 0x100  # per page; hook(addr, val) before a write
+        self._read_hooks = [()] * 0x100  # per page; hook(addr) before a read
+        self._listeners = []  # listener(start, end) after bulk changes
+
+        # page table; None keeps a page on plain ram, anything else is
+        # read(addr) -> val / write(addr, val) for the device mapped there.
+        self._readers = [None] * 0x100
+        self._writers = [None] * 0x100
+
+        self._bind()
+
+    def _bind(self):
+        # fast path; callers pass a masked 16-bit address and an 8-bit value.
+        # each side only leaves it while some page needs a callback.
+        if self._pages is not None:
+            self.read = self._read_paged
+            self.write = self._write_paged
+            return
+        if any(self._readers) or any(self._read_hooks):
+            self.read = self._read_bus
+        else:
+            self.read = self._ram.__getitem__
+        if any(self._hooks) or any(self._writers):
+            self.write = self._write_bus
+        else:
+            self.write = self._ram.__setitem__
+
+    def _read_bus(self, addr):
+        page = addr >> 8
+        for hook in self._read_hooks[page]:
+            hook(addr)
+        device = self._readers[page]
+        if device is None:
+            return self._ram[addr]
+        return device(addr)
+
+    def _write_bus(self, addr, val):
+        page = addr >> 8
+        for hook in self._hooks[page]:
+            hook(addr, val)
+        device = self._writers[page]
+        if device is None:
+            self._ram[addr] = val
+        else:
+            device(addr, val)
+
+    def _read_paged(self, addr):
+        page = addr >> 8
+        for hook in self._read_hooks[page]:
+            hook(addr)
+        device = self._readers[page]
+        if device is None:
+            return self._pages[page][addr & 0xff]
+        return device(addr)
+
+    def _write_paged(self, addr, val):
+        page = addr >> 8
+        for hook in self._hooks[page]:
+            hook(addr, val)
+        device = self._writers[page]
+        if device is not None:
+            device(addr, val)
+            return
+        buf = self._pages[page]
+        if type(buf) is bytes:  # first write since sharing
+            buf = self._pages[page] = bytearray(buf)
+        buf[addr & 0xff] = val
+
+    def add_hook(self, page, hook):
+        if hook not in self._hooks[page]:
+            self._hooks[page] += (hook,)
+            self._bind()
+
+    def remove_hook(self, page, hook):
+        if hook in self._hooks[page]:
+            self._hooks[page] = tuple(h for h in self._hooks[page] if h != hook)
+            self._bind()
+
+    def add_read_hook(self, page, hook):
+        if hook not in self._read_hooks[page]:
+            self._read_hooks[page] += (hook,)
+            self._bind()
+
+    def remove_read_hook(self, page, hook):
+        if hook in self._read_hooks[page]:
+            self._read_hooks[page] = tuple(h for h in self._read_hooks[page]
+                                           if h != hook)
+            self._bind()
+
+    def add_listener(self, listener):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _touched(self, start, end):
+        for listener in self._listeners:
+            listener(start, end)
+
+    #
+    # bulk access; one buffer copy, bypassing the bus.
+
+    def load(self, addr, data):
+        end = addr + len(data)
+        if not 0 <= addr <= end <= 0x10000:
+            raise ValueError('image does not fit at %s' % hex(addr))
+        if self._pages is None:
+            self._ram[addr:end] = data
+        elif end - addr == 0x10000:  # nothing left to share
+            self._ram = bytearray(data)
+            self._pages = None
+            self._bind()
+        elif end > addr:
+            data = memoryview(data)
+            for page in range(addr >> 8, ((end - 1) >> 8) + 1):
+                lo = max(addr, page << 8)
+                hi = min(end, (page + 1) << 8)
+                buf = self._pages[page]
+                if type(buf) is bytes:
+                    buf = self._pages[page] = bytearray(buf)
+                buf[lo & 0xff:((hi - 1) & 0xff) + 1] = data[lo - addr:hi - addr]
+        self._touched(addr, end)
+        return end
+
+    def peek(self, addr):
+        # the stored byte, without hooks or devices.
+        if self._pages is None:
+            return self._ram[addr]
+        return self._pages[addr >> 8][addr & 0xff]
+
+    def image(self):
+        # the whole 64K as one read-only buffer; in flat mode a view of the
+        # live ram, so copy it to keep it.
+        if self._pages is None:
+            return memoryview(self._ram).toreadonly()
+        return b''.join(self._pages)
+
+    #
+    # sharing; see fork() in c6502.py.
+
+    def share(self):
+        # returns the current contents as 256 immutable pages and switches
+        # this Memory to reading them too, so any number of forks taken
+        # without an intervening write share the same page objects.
+        if self._pages is None:
+            ram = bytes(self._ram)
+            self._pages = [ram[page << 8:(page + 1) << 8]
+                           for page in range(0x100)]
+            self._ram = None
+            self._bind()
+        else:
+            self._pages = [bytes(buf) if type(buf) is not bytes else buf
+                           for buf in self._pages]
+        return list(self._pages)
+
+    def unshare(self):
+        # back to one flat private bytearray and the fast path.
+        if self._pages is not None:
+            self._ram = bytearray(b''.join(self._pages))
+            self._pages = None
+            self._bind()
+
+    def dirty_pages(self):
+        # pages copied since the last share(); empty when flat.
+        if self._pages is None:
+            return []
+        return [page for page, buf in enumerate(self._pages)
+                if type(buf) is not bytes]
+
+    #
+    # mapping; ranges are whole pages, first to last inclusive.
+
+    def map(self, first, last, read=None, write=None):
+        for page in range(first, last + 1):
+            self._readers[page] = read
+            self._writers[page] = write
+        self._bind()
+
+    def unmap(self, first, last):
+        self.map(first, last)
+
+    def map_rom(self, first, last, data=None):
+        if data is not None:
+            self.load(first << 8, data)
+        self.map(first, last, write=_ignore)
+
+    def mirror(self, first, last, target):
+        # pages first..last alias the same number of pages from target.
+        offset = (target - first) << 8
+
+        def read(addr):
+            return self.read((addr + offset) & 0xffff)
+
+        def write(addr, val):
+            self.write((addr + offset) & 0xffff, val)
+
+        self.map(first, last, read, write)
 
     def __call__(self, addr, val=None):
         if val is None:
-            return self._ram[addr % 0x10000]
+            return self.read(addr % 0x10000)
         else:
-            self._ram[addr % 0x10000] = val % 0x100
+            self.write(addr % 0x10000, val % 0x100)
+
+
+def _ignore(addr, val):  # writes to rom
+    pass
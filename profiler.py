@@ -0,0 +1,170 @@
+#
+# instruction-level profiler for c6502. Profiler.run() is its own copy of
+# the run loop with counters in it, so C6502.run() carries no profiling cost.
+# counts executions and cycles per opcode, addressing mode and pc, and builds
+# a JSR/RTS call graph exportable as folded stacks for flamegraph tools.
+
+import instructions
+from c6502 import RunResult, _dispatch
+
+
+_calls = (0x00, 0x20)  # BRK, JSR
+_returns = (0x40, 0x60)  # RTI, RTS
+
+
+class Profiler:
+    def __init__(self, cpu, labels=None):
+        self.cpu = cpu
+        self.labels = labels or {}  # addr: name, for reports and stacks
+        self.reset()
+
+    def reset(self):
+        self.op_count = [0] * 0x100
+        self.op_cycles = [0] * 0x100
+        self.pc_count = [0] * 0x10000
+        self.pc_cycles = [0] * 0x10000
+        self.stacks = {}  # (entry, ..., callee): [exclusive cycles]
+        self.inclusive = {}  # callee: cycles, outermost activations only
+        self.edges = {}  # (caller, callee): calls
+
+    def run(self, cycles=None, until_pc=None, max_instructions=None,
+            until=None, brk=True):
+        # same contract as C6502.run.
+        cpu, dispatch, ram = self.cpu, _dispatch, self.cpu.ram
+        op_count, op_cycles = self.op_count, self.op_cycles
+        pc_count, pc_cycles = self.pc_count, self.pc_cycles
+        stacks, inclusive, edges = self.stacks, self.inclusive, self.edges
+
+        start = cpu.cycles
+        deadline = float('inf') if cycles is None else start + cycles
+        limit = -1 if max_instructions is None else max_instructions
+        stop_pc = -1 if until_pc is None else until_pc
+        stop_op = 0x00 if brk else -1
+        count, reason = 0, 'instructions'
+        cpu._arm(deadline)
+
+        key = (cpu.PC,)
+        frames = [(cpu.PC, start)]  # (callee, cycles at entry)
+        cell = stacks.setdefault(key, [0])
+
+        while count != limit:
+            if cpu.cycles >= cpu._deadline:
+                if cpu.cycles >= deadline:
+                    reason = 'cycles'
+                    break
+                pc = cpu.PC
+                cpu._service()
+                if cpu.PC != pc:  # entered a handler; RTI returns from it
+                    edge = (key[-1], cpu.PC)
+                    edges[edge] = edges.get(edge, 0) + 1
+                    key += (cpu.PC,)
+                    frames.append((cpu.PC, cpu.cycles))
+                    cell = stacks.setdefault(key, [0])
+                continue
+            pc = cpu.PC
+            opcode = ram.read(pc)
+            if opcode == stop_op:
+                reason = 'brk'
+                break
+            before = cpu.cycles
+            dispatch[opcode](cpu)
+            spent = cpu.cycles - before
+            count += 1
+
+            op_count[opcode] += 1
+            op_cycles[opcode] += spent
+            pc_count[pc] += 1
+            pc_cycles[pc] += spent
+            cell[0] += spent
+
+            if opcode in _calls:
+                callee = cpu.PC
+                edge = (key[-1], callee)
+                edges[edge] = edges.get(edge, 0) + 1
+                key += (callee,)
+                frames.append((callee, cpu.cycles))
+                cell = stacks.setdefault(key, [0])
+            elif opcode in _returns and len(frames) > 1:
+                callee, entered = frames.pop()
+                key = key[:-1]
+                if callee not in key:  # recursion counts once
+                    inclusive[callee] = (inclusive.get(callee, 0) +
+                                         cpu.cycles - entered)
+                cell = stacks.setdefault(key, [0])
+
+            if cpu.PC == stop_pc:
+                reason = 'pc'
+                break
+            if until is not None and until(cpu):
+                reason = 'until'
+                break
+
+        return RunResult(count, cpu.cycles - start, reason)
+
+    #
+    # results.
+
+    def name(self, addr):
+        return self.labels.get(addr, 'sub_%04x' % addr)
+
+    def by_opcode(self):
+        # [(opcode, mnemonic, mode, count, cycles)], most cycles first.
+        rows = []
+        for opcode in range(0x100):
+            if self.op_count[opcode]:
+                if opcode in instructions._instructions:
+                    func, mode, base = instructions._instructions[opcode]
+                    mnemonic = func.__name__
+                else:
+                    mnemonic, mode = '???', 'imp'
+                rows.append((opcode, mnemonic, mode, self.op_count[opcode],
+                             self.op_cycles[opcode]))
+        return sorted(rows, key=lambda row: -row[4])
+
+    def by_mode(self):
+        # {mode: [count, cycles]}
+        modes = {}
+        for opcode, mnemonic, mode, count, cycles in self.by_opcode():
+            totals = modes.setdefault(mode, [0, 0])
+            totals[0] += count
+            totals[1] += cycles
+        return modes
+
+    def by_pc(self, top=None):
+        # [(pc, count, cycles)], most cycles first.
+        rows = [(pc, self.pc_count[pc], self.pc_cycles[pc])
+                for pc in range(0x10000) if self.pc_count[pc]]
+        return sorted(rows, key=lambda row: -row[2])[:top]
+
+    def exclusive(self):
+        # {callee: cycles spent in its own instructions}
+        totals = {}
+        for key, (cycles,) in self.stacks.items():
+            totals[key[-1]] = totals.get(key[-1], 0) + cycles
+        return totals
+
+    def folded(self):
+        # one 'frame;frame;frame cycles' line per stack, as read by
+        # flamegraph.pl, speedscope and the like.
+        return '\n'.join('%s %d' % (';'.join(self.name(addr) for addr in key),
+                                    cycles)
+                         for key, (cycles,) in sorted(self.stacks.items())
+                         if cycles)
+
+    def report(self, top=10):
+        out = ['opcode       mode        count     cycles']
+        for opcode, mnemonic, mode, count, cycles in self.by_opcode()[:top]:
+            out.append('0x%02x %s    %s  %10d %10d' %
+                       (opcode, mnemonic, mode, count, cycles))
+        out.append('')
+        out.append('pc                count     cycles')
+        for pc, count, cycles in self.by_pc(top):
+            out.append('0x%04x      %10d %10d' % (pc, count, cycles))
+        out.append('')
+        out.append('routine       inclusive  exclusive')
+        exclusive = self.exclusive()
+        for addr in sorted(exclusive, key=lambda addr: -exclusive[addr])[:top]:
+            out.append('%-12s %10d %10d' % (self.name(addr),
+                                            self.inclusive.get(addr, 0),
+                                            exclusive[addr]))
+        return '\n'.join(out)
@@ -1,12 +1,21 @@
 #
 # simple debugger / memory editor for c6502.
-# python 2.7
+# python 3
 
+import asm
+import loader
+from breakpoints import Debugger, parse_condition
 from c6502 import C6502
+from disasm import Disassembler
+from timetravel import Recorder
 from collections import namedtuple, OrderedDict
 
 cpu = C6502()
+dbg = Debugger(cpu)
+rec = Recorder(cpu)
+dis = Disassembler(cpu.ram)
 cur_addr = 0x0
+snapshots = {}
 
 def hexf(i, w=2): # w == width in nibbles
     return '0x' + hex(i)[2:].zfill(w)
@@ -16,7 +25,29 @@ def hexf(i, w=2): # w == width in nibbles
 # commands.
 
 def load_file(*args): # filename, addr
-    pass
+    addr = int(args[1], 16) if len(args) > 1 else None
+    if addr is None and loader.guess_format(args[0]) == 'raw':
+        addr = cur_addr
+
+    (start, end), entry = loader.load_file(cpu, args[0], addr)
+    out = '%s - %s (%d bytes)' % (hexf(start, 4), hexf(end - 1, 4), end - start)
+    if entry is not None:
+        out += '\treset -> %s' % hexf(entry, 4)
+
+    return out
+
+
+def assemble(*args): # filename, [org]
+    org = int(args[1], 16) if len(args) > 1 else cur_addr
+    with open(args[0]) as f:
+        program = asm.assemble_into(cpu, f.read(), org)
+
+    out = ''
+    for addr, data in program.segments:
+        out += '%s - %s (%d bytes)\n' % (hexf(addr, 4),
+                hexf(addr + len(data) - 1, 4), len(data))
+
+    return out + '%d labels' % len(program.labels)
 
 
 def jumpto(*args): # addr
@@ -41,15 +72,125 @@ def step(*args):
         steps = 1
 
     for step in range(steps):
-        cpu.step()
+        rec.run(max_instructions=1, brk=False)
         pcv.append(hexf(cpu.pc(), 4) + '\n')
 
     return '\t-> '.join(pcv).strip()
 
 
+def run(*args): # [until_pc [max_instructions]]
+    until_pc = int(args[0], 16) if len(args) > 0 else None
+    limit = int(args[1], 16) if len(args) > 1 else None
+
+    result = rec.run(max_instructions=limit, until_pc=until_pc)
+
+    return '%s after %d instructions\tpc -> %s' % \
+            (result.reason, result.instructions, hexf(cpu.pc(), 4))
+
+
+def go(*args): # [max_instructions]
+    limit = int(args[0], 16) if len(args) else None
+
+    result = rec.run(dbg.run, max_instructions=limit)
+
+    out = '%s after %d instructions\tpc -> %s' % \
+            (result.reason, result.instructions, hexf(cpu.pc(), 4))
+    if result.reason == 'watch':
+        kind, addr, val = dbg.hit
+        out += '\n%s %s' % (kind, hexf(addr, 4))
+        if val is not None:
+            out += ' <- #%s' % hexf(val)
+
+    return out
+
+
+def back(*args): # [n]
+    steps = int(args[0], 16) if len(args) else 1
+    rec.step_back(steps)
+    return 'back %d\tpc -> %s' % (steps, hexf(cpu.pc(), 4))
+
+
+def backto(*args): # addr
+    addr = int(args[0], 16) % 0x10000
+    rec.run_back_to(addr)
+    return 'back at instruction %d\tpc -> %s' % (rec.position, hexf(cpu.pc(), 4))
+
+
+def breakpoint(*args): # [addr [condition]]
+    if not len(args):
+        return '\n'.join('%s %s' % (hexf(pc, 4),
+                getattr(dbg.conditions.get(pc), 'expr', ''))
+                for pc in dbg.breaks())
+
+    addr = int(args[0], 16) % 0x10000
+    condition = parse_condition(' '.join(args[1:])) if len(args) > 1 else None
+    dbg.add_break(addr, condition)
+
+    return 'break at %s' % hexf(addr, 4)
+
+
+def delbreak(*args): # addr
+    addr = int(args[0], 16) % 0x10000
+    dbg.remove_break(addr)
+    return 'cleared %s' % hexf(addr, 4)
+
+
+def watch(*args): # [addr [r|w|rw]]
+    if not len(args):
+        return '\n'.join('%s %s%s' % (hexf(addr, 4), 'r' if r else '',
+                'w' if w else '') for addr, r, w in dbg.watches())
+
+    addr = int(args[0], 16) % 0x10000
+    kind = args[1] if len(args) > 1 else 'w'
+    dbg.watch(addr, read='r' in kind, write='w' in kind)
+
+    return 'watching %s (%s)' % (hexf(addr, 4), kind)
+
+
+def unwatch(*args): # addr
+    addr = int(args[0], 16) % 0x10000
+    dbg.unwatch(addr)
+    return 'unwatched %s' % hexf(addr, 4)
+
+
 def reset(*args):
-    global cpu
+    global cpu, dbg, rec, dis
+    rec.close()
+    dis.close()
     cpu = C6502()
+    dbg = Debugger(cpu)
+    rec = Recorder(cpu)
+    dis = Disassembler(cpu.ram)
+
+
+def irq(*args): # [0 to release]
+    if len(args) and not int(args[0], 16):
+        cpu.release_irq()
+        return 'irq released'
+    cpu.irq()
+    return 'irq held'
+
+
+def nmi(*args):
+    cpu.nmi()
+    return 'nmi pending'
+
+
+def rst(*args):
+    cpu.reset()
+    return 'reset pending'
+
+
+def snap(*args): # [name]
+    name = args[0] if len(args) else '0'
+    snapshots[name] = cpu.snapshot()
+    return 'saved %s at pc %s' % (name, hexf(cpu.pc(), 4))
+
+
+def restore(*args): # [name]
+    name = args[0] if len(args) else '0'
+    cpu.restore(snapshots[name])
+    return 'restored %s at pc %s' % (name, hexf(cpu.pc(), 4))
 
 
 def pram(*args): # addr, mem
@@ -75,6 +216,12 @@ def pram(*args): # addr, mem
         return '#%s -> %s (%s)' % (hexf(mem), hexf(addr, 4), hexf(val))
 
 
+def disassemble(*args): # [addr [lines]]
+    addr = int(args[0], 16) % 0x10000 if len(args) else cur_addr
+    count = int(args[1], 16) if len(args) > 1 else 0x10
+    return dis.listing(addr, count)
+
+
 def dumpram(*args): # stop
     global cur_addr
     out = ''
@@ -102,7 +249,7 @@ def reg(*args):
 
     if len(args) == 0:
         data = map(lambda reg: reg(), registers.values())
-        matched = zip(registers, map(hexf, data)) + [('pc', hexf(cpu.pc(), 4))]
+        matched = list(zip(registers, map(hexf, data))) + [('pc', hexf(cpu.pc(), 4))]
         for r in [x[0] + ' ' + x[1] + ' ' for x in matched]:
             out += r
         else:
@@ -175,9 +322,25 @@ cmdpkg = namedtuple('cmdpkg', 'func args mina maxa')
 
 cmds = {            # 'exit' not included (handled in __main__)
         'step':     {'func':step,       'mina':0, 'maxa':1},
+        'run':      {'func':run,        'mina':0, 'maxa':2},
+        'go':       {'func':go,         'mina':0, 'maxa':1},
+        'back':     {'func':back,       'mina':0, 'maxa':1},
+        'backto':   {'func':backto,     'mina':1, 'maxa':1},
+        'bp':       {'func':breakpoint, 'mina':0, 'maxa':-1},
+        'bpd':      {'func':delbreak,   'mina':1, 'maxa':1},
+        'wat':      {'func':watch,      'mina':0, 'maxa':2},
+        'watd':     {'func':unwatch,    'mina':1, 'maxa':1},
         'reset':    {'func':reset,      'mina':0, 'maxa':0},
+        'irq':      {'func':irq,        'mina':0, 'maxa':1},
+        'nmi':      {'func':nmi,        'mina':0, 'maxa':0},
+        'rst':      {'func':rst,        'mina':0, 'maxa':0},
+        'load':     {'func':load_file,  'mina':1, 'maxa':2},
+        'asm':      {'func':assemble,   'mina':1, 'maxa':2},
+        'snap':     {'func':snap,       'mina':0, 'maxa':1},
+        'rest':     {'func':restore,    'mina':0, 'maxa':1},
         'cc':       {'func':jumpto,     'mina':0, 'maxa':1},
         'pram':     {'func':pram,       'mina':0, 'maxa':-1},
+        'dis':      {'func':disassemble, 'mina':0, 'maxa':2},
         'dmp':      {'func':dumpram,    'mina':0, 'maxa':2},
         'reg':      {'func':reg,        'mina':0, 'maxa':2},
         'flg':      {'func':dumpflags,  'mina':0, 'maxa':0},
@@ -209,7 +372,7 @@ if __name__ == '__main__':
 
     while True:
         prompt_text = hexf(cur_addr, 4)
-        str_in = raw_input(prompt_text + '> ')
+        str_in = input(prompt_text + '> ')
         if not len(str_in) or str_in.isspace():
             cmd = None
         elif '#' in str_in.lstrip():
@@ -0,0 +1,72 @@
+#
+# cycle-scheduled events for c6502 devices. events sit in a heap keyed by
+# absolute cycle count and the cpu's run loops only look at it when cycles
+# reach the earliest one (cpu._deadline), so devices cost nothing between
+# their events however many of them there are.
+
+import heapq
+import itertools
+
+
+class Scheduler:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self._heap = []  # [cycle, seq, callback, args]; callback None once cancelled
+        self._seq = itertools.count()  # keeps same-cycle events in order
+        self.due = float('inf')  # cycle of the earliest event
+        cpu.scheduler = self
+
+    def close(self):
+        if self.cpu.scheduler is self:
+            self.cpu.scheduler = None
+
+    def at(self, cycle, callback, *args):
+        # callback(cycle, *args) once cpu.cycles reaches cycle, between
+        # instructions; returns a handle for cancel().
+        event = [cycle, next(self._seq), callback, args]
+        heapq.heappush(self._heap, event)
+        if cycle < self.due:
+            self.due = cycle
+            if cycle < self.cpu._deadline:
+                self.cpu._deadline = cycle
+        return event
+
+    def after(self, cycles, callback, *args):
+        return self.at(self.cpu.cycles + cycles, callback, *args)
+
+    def every(self, period, callback, *args, start=None):
+        # callback(cycle, *args) every period cycles, counted from the
+        # scheduled cycles so lateness does not accumulate. the handle
+        # cancels the whole series.
+        event = [None]
+
+        def tick(cycle, *args):
+            callback(cycle, *args)
+            if event[0][2] is not None:
+                event[0] = self.at(cycle + period, tick, *args)
+
+        first = self.cpu.cycles + period if start is None else start
+        event[0] = self.at(first, tick, *args)
+        return event
+
+    def cancel(self, event):
+        # cancelled events stay in the heap until they come up.
+        if isinstance(event[0], list):  # a series from every()
+            event[0][2] = None
+        else:
+            event[2] = None
+
+    def pending(self):
+        # [(cycle, callback)] still to fire, earliest first.
+        return [(cycle, callback) for cycle, seq, callback, args
+                in sorted(self._heap) if callback is not None]
+
+    def fire(self):
+        # runs every event due by cpu.cycles, earliest first, including any
+        # they schedule for cycles already reached.
+        heap, cycles = self._heap, self.cpu.cycles
+        while heap and heap[0][0] <= cycles:
+            cycle, seq, callback, args = heapq.heappop(heap)
+            if callback is not None:
+                callback(cycle, *args)
+        self.due = heap[0][0] if heap else float('inf')
@@ -0,0 +1,347 @@
+#
+# lockstep engine; runs N copies of a c6502 as numpy arrays, one lane per
+# cpu. each step groups the active lanes by the opcode under their pc and
+# applies that instruction to the whole group at once. lanes diverging on
+# branches simply land in different groups on later steps.
+#
+# lanes have plain ram only (no bus devices or hooks). requires numpy.
+
+import numpy as np
+
+import instructions
+from c6502 import C6502
+from instructionset import *
+from instructionset import _adc, _nz, _sbc
+
+
+_NZ = np.frombuffer(_nz, np.uint8).astype(np.int32)
+_ADC = np.frombuffer(_adc, np.uint16).astype(np.int32)
+_SBC = np.frombuffer(_sbc, np.uint16).astype(np.int32)
+
+
+class Lanes:
+    def __init__(self, n):
+        self.n = n
+        self.A = np.zeros(n, np.int32)
+        self.X = np.zeros(n, np.int32)
+        self.Y = np.zeros(n, np.int32)
+        self.SP = np.full(n, 0xff, np.int32)
+        self.PC = np.zeros(n, np.int32)
+        self.P = np.full(n, 0x24, np.int32)
+        self.cycles = np.zeros(n, np.int64)
+        self.instructions = np.zeros(n, np.int64)
+        self.ram = np.zeros((n, 0x10000), np.uint8)
+        self.halted = np.zeros(n, bool)
+
+    @classmethod
+    def from_cpu(cls, cpu, n):
+        # n lanes all starting from cpu's current state.
+        lanes = cls(n)
+        for reg in ('A', 'X', 'Y', 'SP', 'PC', 'P', 'cycles'):
+            getattr(lanes, reg)[:] = getattr(cpu, reg)
+        lanes.ram[:] = np.frombuffer(bytes(cpu.ram.image()), np.uint8)
+        return lanes
+
+    def lane(self, i):
+        # a scalar C6502 holding lane i's state.
+        cpu = C6502()
+        for reg in ('A', 'X', 'Y', 'SP', 'PC', 'P', 'cycles'):
+            setattr(cpu, reg, int(getattr(self, reg)[i]))
+        cpu.ram.load(0x0, self.ram[i].tobytes())
+        return cpu
+
+    #
+    # per-group helpers; idx is an array of lane numbers.
+
+    def _read(self, idx, addr):
+        return self.ram[idx, addr].astype(np.int32)
+
+    def _write(self, idx, addr, val):
+        self.ram[idx, addr] = val
+
+    def _operand(self, idx, mode, op):
+        return op if mode == 'imm' else self._read(idx, op)
+
+    def _set_nz(self, idx, val):
+        self.P[idx] = (self.P[idx] & 0x7d) | _NZ[val]
+
+    def _push(self, idx, val):
+        self.ram[idx, self.SP[idx] + 0x100] = val
+        self.SP[idx] = (self.SP[idx] - 1) & 0xff
+
+    def _pull(self, idx):
+        self.SP[idx] = (self.SP[idx] + 1) & 0xff
+        return self._read(idx, self.SP[idx] + 0x100)
+
+    def _resolve(self, idx, opcode, mode, arg):
+        if mode in ('imm', 'zpg', 'abs'):
+            return arg
+        if mode in ('imp', 'acc'):
+            return None
+        if mode == 'zpx':
+            return (arg + self.X[idx]) & 0xff
+        if mode == 'zpy':
+            return (arg + self.Y[idx]) & 0xff
+        if mode == 'rel':
+            return (self.PC[idx] + np.where(arg & 0x80, arg - 0x100, arg)) & 0xffff
+        if mode == 'ind':
+            return (self._read(idx, (arg + 1) & 0xffff) << 8) | self._read(idx, arg)
+        if mode == 'iix':
+            ptr = (arg + self.X[idx]) & 0xff
+            return (self._read(idx, (ptr + 1) & 0xff) << 8) | self._read(idx, ptr)
+
+        if mode == 'abx':
+            base = arg
+            addr = (arg + self.X[idx]) & 0xffff
+        elif mode == 'aby':
+            base = arg
+            addr = (arg + self.Y[idx]) & 0xffff
+        else:  # iiy
+            base = (self._read(idx, (arg + 1) & 0xff) << 8) | self._read(idx, arg)
+            addr = (base + self.Y[idx]) & 0xffff
+        if instructions.has_page_penalty(opcode):
+            self.cycles[idx] += ((base ^ addr) & 0xff00) != 0
+        return addr
+
+    #
+    # execution.
+
+    def _execute(self, opcode, idx):
+        if opcode not in instructions._instructions:  # passed as a NOP
+            self.PC[idx] = (self.PC[idx] + 1) & 0xffff
+            self.cycles[idx] += 2
+            return
+
+        func, mode, cycles = instructions._instructions[opcode]
+        size = instructions._sizes[mode]
+        pc = self.PC[idx]
+        arg = None
+        if size == 2:
+            arg = self._read(idx, (pc + 1) & 0xffff)
+        elif size == 3:
+            arg = ((self._read(idx, (pc + 2) & 0xffff) << 8) |
+                   self._read(idx, (pc + 1) & 0xffff))
+        self.PC[idx] = (pc + size) & 0xffff
+        self.cycles[idx] += cycles
+
+        _vector[func](self, idx, mode, self._resolve(idx, opcode, mode, arg))
+
+    def step(self, brk=True):
+        # one instruction on every active lane; returns how many ran.
+        lanes = np.flatnonzero(~self.halted)
+        ops = self.ram[lanes, self.PC[lanes]]
+        if brk:
+            self.halted[lanes[ops == 0x00]] = True
+            lanes, ops = lanes[ops != 0x00], ops[ops != 0x00]
+
+        for opcode in np.unique(ops):
+            self._execute(int(opcode), lanes[ops == opcode])
+        self.instructions[lanes] += 1
+
+        return lanes.size
+
+    def run(self, max_steps=None, until_pc=None, brk=True):
+        # steps until every lane has halted (BRK if brk, or reaching
+        # until_pc) or max_steps have run; returns the steps taken.
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            if not self.step(brk):
+                break
+            steps += 1
+            if until_pc is not None:
+                self.halted |= self.PC == until_pc
+        return steps
+
+
+#
+# vectorized instructions, one per instructionset function; same semantics,
+# applied to the lanes in idx.
+
+def _load(reg):
+    def load(s, idx, mode, op):
+        val = s._operand(idx, mode, op)
+        getattr(s, reg)[idx] = val
+        s._set_nz(idx, val)
+    return load
+
+
+def _store(reg):
+    def store(s, idx, mode, op):
+        s._write(idx, op, getattr(s, reg)[idx])
+    return store
+
+
+def _transfer(src, dst):
+    def transfer(s, idx, mode, op):
+        val = getattr(s, src)[idx]
+        getattr(s, dst)[idx] = val
+        if dst != 'SP':
+            s._set_nz(idx, val)
+    return transfer
+
+
+def _step(reg, delta):
+    def step(s, idx, mode, op):
+        val = (getattr(s, reg)[idx] + delta) & 0xff
+        getattr(s, reg)[idx] = val
+        s._set_nz(idx, val)
+    return step
+
+
+def _step_mem(delta):
+    def step(s, idx, mode, op):
+        val = (s._read(idx, op) + delta) & 0xff
+        s._write(idx, op, val)
+        s._set_nz(idx, val)
+    return step
+
+
+def _logic(fn):
+    def logic(s, idx, mode, op):
+        val = fn(s.A[idx], s._operand(idx, mode, op))
+        s.A[idx] = val
+        s._set_nz(idx, val)
+    return logic
+
+
+def _compare(reg):
+    def compare(s, idx, mode, op):
+        val = getattr(s, reg)[idx] - s._operand(idx, mode, op)
+        s.P[idx] = (s.P[idx] & 0x7c) | _NZ[val & 0xff] | (val >= 0)
+    return compare
+
+
+def _flag(mask, on):
+    def flag(s, idx, mode, op):
+        if on:
+            s.P[idx] |= mask
+        else:
+            s.P[idx] &= ~mask & 0xff
+    return flag
+
+
+def _branch(mask, on):
+    def branch(s, idx, mode, op):
+        taken = (s.P[idx] & mask) != 0
+        if not on:
+            taken = ~taken
+        idx, op = idx[taken], op[taken]
+        s.cycles[idx] += np.where((s.PC[idx] ^ op) & 0xff00, 2, 1)
+        s.PC[idx] = op
+    return branch
+
+
+def _shift(fn):
+    # fn(val, carry) -> (result, carry out)
+    def shift(s, idx, mode, op):
+        mem = s.A[idx] if mode == 'acc' else s._read(idx, op)
+        val, carry = fn(mem, s.P[idx] & 0x01)
+        if mode == 'acc':
+            s.A[idx] = val
+        else:
+            s._write(idx, op, val)
+        s.P[idx] = (s.P[idx] & 0x7c) | _NZ[val] | carry
+    return shift
+
+
+def _arithmetic(table):
+    def arithmetic(s, idx, mode, op):
+        p = s.P[idx]
+        val = table[((p & 0x08) << 14) | ((p & 0x01) << 16) | (s.A[idx] << 8) |
+                    s._operand(idx, mode, op)]
+        s.A[idx] = val & 0xff
+        s.P[idx] = (p & 0x3c) | (val >> 8)
+    return arithmetic
+
+
+def _bit(s, idx, mode, op):
+    mem = s._read(idx, op)
+    s.P[idx] = ((s.P[idx] & 0x3d) | (mem & 0xc0) |
+                np.where(s.A[idx] & mem, 0, 0x02))
+
+
+def _brk(s, idx, mode, op):
+    pc = (s.PC[idx] + 1) & 0xffff
+    s._push(idx, pc >> 8)
+    s._push(idx, pc & 0xff)
+    s._push(idx, s.P[idx] | 0x30)
+    s.P[idx] |= 0x04
+    s.PC[idx] = (s._read(idx, np.full(idx.size, 0xffff)) << 8) | \
+        s._read(idx, np.full(idx.size, 0xfffe))
+
+
+def _jmp(s, idx, mode, op):
+    s.PC[idx] = op
+
+
+def _jsr(s, idx, mode, op):
+    mem = (s.PC[idx] - 1) & 0xffff
+    s._push(idx, mem >> 8)
+    s._push(idx, mem & 0xff)
+    s.PC[idx] = op
+
+
+def _nop(s, idx, mode, op):
+    pass
+
+
+def _pha(s, idx, mode, op):
+    s._push(idx, s.A[idx])
+
+
+def _php(s, idx, mode, op):
+    s._push(idx, s.P[idx] | 0x30)
+
+
+def _pla(s, idx, mode, op):
+    val = s._pull(idx)
+    s.A[idx] = val
+    s._set_nz(idx, val)
+
+
+def _plp(s, idx, mode, op):
+    s.P[idx] = (s._pull(idx) & 0xef) | 0x20
+
+
+def _rti(s, idx, mode, op):
+    s.P[idx] = (s._pull(idx) & 0xef) | 0x20
+    lo = s._pull(idx)
+    hi = s._pull(idx)
+    s.PC[idx] = (hi << 8) | lo
+
+
+def _rts(s, idx, mode, op):
+    lo = s._pull(idx)
+    hi = s._pull(idx)
+    s.PC[idx] = (((hi << 8) | lo) + 1) & 0xffff
+
+
+_vector = {
+    ADC: _arithmetic(_ADC), AND: _logic(np.bitwise_and), EOR: _logic(np.bitwise_xor),
+    ORA: _logic(np.bitwise_or), BIT: _bit,
+    ASL: _shift(lambda val, c: ((val << 1) & 0xff, val >> 7)),
+    LSR: _shift(lambda val, c: (val >> 1, val & 0x1)),
+    ROL: _shift(lambda val, c: (((val << 1) & 0xff) | c, val >> 7)),
+    ROR: _shift(lambda val, c: ((val >> 1) | (c << 7), val & 0x1)),
+    BCC: _branch(0x01, False), BCS: _branch(0x01, True),
+    BNE: _branch(0x02, False), BEQ: _branch(0x02, True),
+    BPL: _branch(0x80, False), BMI: _branch(0x80, True),
+    BVC: _branch(0x40, False), BVS: _branch(0x40, True),
+    BRK: _brk,
+    CLC: _flag(0x01, False), SEC: _flag(0x01, True),
+    CLD: _flag(0x08, False), SED: _flag(0x08, True),
+    CLI: _flag(0x04, False), SEI: _flag(0x04, True),
+    CLV: _flag(0x40, False),
+    CMP: _compare('A'), CPX: _compare('X'), CPY: _compare('Y'),
+    DEC: _step_mem(-1), INC: _step_mem(1),
+    DEX: _step('X', -1), DEY: _step('Y', -1),
+    INX: _step('X', 1), INY: _step('Y', 1),
+    JMP: _jmp, JSR: _jsr, NOP: _nop,
+    LDA: _load('A'), LDX: _load('X'), LDY: _load('Y'),
+    STA: _store('A'), STX: _store('X'), STY: _store('Y'),
+    PHA: _pha, PHP: _php, PLA: _pla, PLP: _plp, RTI: _rti, RTS: _rts,
+    SBC: _arithmetic(_SBC),
+    TAX: _transfer('A', 'X'), TAY: _transfer('A', 'Y'),
+    TSX: _transfer('SP', 'X'), TXA: _transfer('X', 'A'),
+    TXS: _transfer('X', 'SP'), TYA: _transfer('Y', 'A'),
+}
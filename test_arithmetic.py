@@ -0,0 +1,73 @@
+#
+# the ADC/SBC tables in instructionset.py against a direct per-entry
+# implementation, over all 2^18 (decimal, carry, a, operand) inputs.
+
+from instructionset import _adc, _nz, _sbc
+
+
+def _binary(a, m, c):
+    s = a + m + c
+    v = ((a ^ s) & (m ^ s) & 0x80) >> 1
+    return ((_nz[s & 0xff] | v | (s >> 8)) << 8) | (s & 0xff)
+
+
+def _signed(val):
+    return val - ((val & 0x80) << 1)
+
+
+def _adc_decimal(a, m, c):
+    # NMOS: n and v from the high nibble sum before its adjustment, z from
+    # the binary sum.
+    lo = (a & 0x0f) + (m & 0x0f) + c
+    if lo >= 0x0a:
+        lo = ((lo + 0x06) & 0x0f) + 0x10
+    hi = (a & 0xf0) + (m & 0xf0) + lo
+    signed = _signed(a & 0xf0) + _signed(m & 0xf0) + lo
+    flags = ((hi & 0x80) | (0x40 if not -0x80 <= signed <= 0x7f else 0x0) |
+             (0x02 if not (a + m + c) & 0xff else 0x0))
+    if hi >= 0xa0:
+        hi += 0x60
+    return ((flags | (hi >= 0x100)) << 8) | (hi & 0xff)
+
+
+def _sbc_decimal(a, m, c):
+    # NMOS: flags as in binary mode.
+    lo = (a & 0x0f) - (m & 0x0f) + c - 1
+    if lo < 0:
+        lo = ((lo - 0x06) & 0x0f) - 0x10
+    val = (a & 0xf0) - (m & 0xf0) + lo
+    if val < 0:
+        val -= 0x60
+    return (_binary(a, m ^ 0xff, c) & 0xff00) | (val & 0xff)
+
+
+def _check(table, binary, decimal):
+    bad = []
+    for d in (0, 1):
+        func = decimal if d else binary
+        for c in (0, 1):
+            for a in range(0x100):
+                base = (d << 17) | (c << 16) | (a << 8)
+                for m in range(0x100):
+                    if table[base | m] != func(a, m, c):
+                        bad.append((d, c, a, m))
+    return bad
+
+
+def test_adc():
+    assert len(_adc) == 1 << 18
+    assert _check(_adc, _binary, _adc_decimal) == []
+
+
+def test_sbc():
+    assert len(_sbc) == 1 << 18
+    assert _check(_sbc, lambda a, m, c: _binary(a, m ^ 0xff, c),
+                  _sbc_decimal) == []
+
+
+def test_known():
+    # (decimal, carry, a, operand): (flags << 8) | result
+    assert _adc[(1 << 17) | (1 << 16) | (0x58 << 8) | 0x46] == 0xc105
+    assert _adc[(1 << 17) | (0x99 << 8) | 0x01] == 0x8100
+    assert _sbc[(1 << 17) | (1 << 16) | (0x12 << 8) | 0x21] == 0x8091
+    assert _adc[(0x7f << 8) | 0x01] == 0xc080
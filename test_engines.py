@@ -0,0 +1,113 @@
+#
+# seeded random programs run on C6502.run(), the Translator and Lanes; all
+# three must end in the same state. a failing seed reproduces on its own.
+
+import random
+
+import pytest
+
+import instructions
+from c6502 import C6502
+from scheduler import Scheduler
+from translate import Translator
+
+
+_programs = 300
+_length = 3000  # instructions per program
+_opcodes = [op for op in instructions._instructions if op not in (0x00, 0x40)]
+
+
+def _image(rnd):
+    # random memory, with mostly valid opcodes at $0200-$03ff.
+    image = bytearray(rnd.randbytes(0x10000))
+    for addr in range(0x0200, 0x0400):
+        if rnd.random() < 0.6:
+            image[addr] = rnd.choice(_opcodes)
+    return image
+
+
+def _cpu(seed):
+    rnd = random.Random(seed)
+    cpu = C6502()
+    cpu.ram.load(0x0, _image(rnd))
+    cpu.PC, cpu.SP = 0x200, 0xfd
+    cpu.A = rnd.getrandbits(8)
+    cpu.P = rnd.getrandbits(8) | 0x20  # decimal mode too
+    return cpu
+
+
+def _state(cpu):
+    return (cpu.A, cpu.X, cpu.Y, cpu.SP, cpu.PC, cpu.P, cpu.cycles,
+            bytes(cpu.ram.image()))
+
+
+def test_translator(capsys):
+    bad = []
+    for seed in range(_programs):
+        cpu, other = _cpu(seed), _cpu(seed)
+        result = cpu.run(max_instructions=_length, brk=False)
+        if Translator(other).run(max_instructions=_length, brk=False) != result \
+                or _state(other) != _state(cpu):
+            bad.append(seed)
+    assert bad == []
+
+
+def _slices(seed, cpu, run):
+    # runs in random cycle budgets with a periodic event; returns each
+    # run's result and where every event found the cpu.
+    rnd, results, events = random.Random(-seed), [], []
+    Scheduler(cpu).every(rnd.randint(7, 200), lambda cycle: events.append(
+        (cycle, cpu.cycles, cpu.PC)))
+    while cpu.cycles < _length * 3:
+        results.append(run(cycles=rnd.randint(1, 300), brk=False))
+    return results, events, _state(cpu)
+
+
+def test_translator_cycles(capsys):
+    bad = []
+    for seed in range(_programs // 3):
+        cpu, other = _cpu(seed), _cpu(seed)
+        if _slices(seed, cpu, cpu.run) != \
+                _slices(seed, other, Translator(other).run):
+            bad.append(seed)
+    assert bad == []
+
+
+def test_translator_page_penalties():
+    # page crossings add cycles that a block has to allow for up front.
+    cpu, other = C6502(), C6502()
+    code = bytes((0xbd, 0xff, 0x10) * 4 + (0xea, 0x4c, 0x00, 0x02))
+    for c in (cpu, other):  # LDA $10ff,X x4; NOP; JMP $0200
+        c.ram.load(0x200, code)
+        c.PC, c.X = 0x200, 0x01
+    result = cpu.run(cycles=21)
+    assert Translator(other).run(cycles=21) == result
+    assert _state(other) == _state(cpu)
+
+
+def test_lanes(capsys):
+    pytest.importorskip('numpy')
+    from simd import Lanes
+
+    cpus = [_cpu(seed) for seed in range(_programs)]
+    lanes = Lanes(len(cpus))
+    for i, cpu in enumerate(cpus):
+        lanes.ram[i] = memoryview(cpu.ram.image())
+        for reg in ('A', 'X', 'Y', 'SP', 'PC', 'P'):
+            getattr(lanes, reg)[i] = getattr(cpu, reg)
+        cpu.run(max_instructions=_length, brk=False)
+    lanes.run(max_steps=_length, brk=False)
+    assert [i for i, cpu in enumerate(cpus)
+            if _state(lanes.lane(i)) != _state(cpu)] == []
+
+
+def test_translator_wrap():
+    # an instruction ending exactly at $10000 wraps pc to $0000.
+    cpu, other = C6502(), C6502()
+    for c in (cpu, other):
+        c.ram.load(0xfffd, bytes((0xea, 0xa9, 0x01)))  # NOP; LDA #$01
+        c.ram.load(0x0, bytes((0xe8,)))  # INX
+        c.PC = 0xfffd
+    result = cpu.run(max_instructions=3)
+    assert Translator(other).run(max_instructions=3) == result
+    assert _state(other) == _state(cpu)
@@ -0,0 +1,173 @@
+#
+# reverse execution for c6502. while recording, a checkpoint (snapshot) is
+# taken every `interval` instructions and, between checkpoints, a journal
+# keeps the registers after each instruction and every ram write. going
+# back restores the nearest earlier checkpoint and replays the journal up to
+# the wanted instruction. only the newest `keep` checkpoints are held.
+#
+# devices mapped on the bus are not rewound.
+
+from array import array
+
+from c6502 import _state
+
+
+class _Segment:
+    __slots__ = ('start', 'blob', 'regs', 'cycles', 'ends', 'addrs', 'vals')
+
+    def __init__(self, start, blob):
+        self.start = start  # position of the checkpoint
+        self.blob = blob
+        self.regs = array('Q')  # per instruction: a x y sp p pc, packed
+        self.cycles = array('Q')
+        self.ends = array('L')  # per instruction: writes journaled so far
+        self.addrs = array('H')
+        self.vals = array('B')
+
+
+class Recorder:
+    def __init__(self, cpu, interval=0x1000, keep=32):
+        self.cpu = cpu
+        self.interval = interval
+        self.keep = keep
+        self._segments = []
+        self._restoring = False
+        self._checkpoint(0)
+
+        for page in range(0x100):
+            cpu.ram.add_hook(page, self._on_write)
+        cpu.ram.add_listener(self._on_load)
+
+    def close(self):
+        for page in range(0x100):
+            self.cpu.ram.remove_hook(page, self._on_write)
+        self.cpu.ram.remove_listener(self._on_load)
+
+    @property
+    def position(self):
+        # instructions recorded since the recorder was created.
+        seg = self._segments[-1]
+        return seg.start + len(seg.regs)
+
+    @property
+    def earliest(self):
+        return self._segments[0].start
+
+    #
+    # recording.
+
+    def _checkpoint(self, position):
+        self._segments.append(_Segment(position, self.cpu.snapshot()))
+        if len(self._segments) > self.keep:
+            del self._segments[0]
+
+    def _on_write(self, addr, val):
+        if self.cpu.ram._writers[addr >> 8] is None:  # ram, not a device
+            seg = self._segments[-1]
+            seg.addrs.append(addr)
+            seg.vals.append(val)
+
+    def _on_load(self, start, end):
+        # bulk changes are not journaled; start over from a fresh checkpoint.
+        if not self._restoring:
+            self._checkpoint(self.position)
+
+    def _record(self, cpu):
+        seg = self._segments[-1]
+        seg.regs.append(_pack(cpu.A, cpu.X, cpu.Y, cpu.SP, cpu.P, cpu.PC))
+        seg.cycles.append(cpu.cycles)
+        seg.ends.append(len(seg.addrs))
+        if len(seg.regs) >= self.interval:
+            self._checkpoint(seg.start + len(seg.regs))
+        return False
+
+    def _sync(self):
+        # registers set or ram written since the last recorded instruction
+        # would be lost going back to the start of a run; checkpoint them.
+        cpu, seg, position = self.cpu, self._segments[-1], self.position
+        if seg.regs:
+            last = (seg.regs[-1], seg.cycles[-1])
+            written = len(seg.addrs) > seg.ends[-1]
+        else:
+            magic, a, x, y, sp, p, pc, cycles = _state.unpack_from(seg.blob)
+            last = (_pack(a, x, y, sp, p, pc), cycles)
+            written = len(seg.addrs) > 0
+        now = (_pack(cpu.A, cpu.X, cpu.Y, cpu.SP, cpu.P, cpu.PC), cpu.cycles)
+        if written or last != now:
+            if not seg.regs:  # nothing ran from it; replace it
+                del self._segments[-1]
+            self._checkpoint(position)
+
+    def run(self, runner=None, until=None, **kwargs):
+        # runs runner (cpu.run by default, or e.g. a Debugger's run) with
+        # recording; takes and returns the same as C6502.run.
+        runner = self.cpu.run if runner is None else runner
+        self._sync()
+        record, before = self._record, self.position
+
+        if until is None:
+            check = record
+        else:
+            def check(cpu):
+                record(cpu)
+                return until(cpu)
+
+        result = runner(until=check, **kwargs)
+        if self.position - before < result.instructions:
+            record(self.cpu)  # the loop stopped before asking about the last
+        return result
+
+    #
+    # going back.
+
+    def seek(self, position):
+        # puts the cpu back to just before instruction `position` ran.
+        if not self.earliest <= position <= self.position:
+            raise ValueError('position %d not recorded' % position)
+        for index in range(len(self._segments) - 1, -1, -1):
+            seg = self._segments[index]
+            if seg.start <= position:
+                break
+        del self._segments[index + 1:]
+
+        cpu, count = self.cpu, position - seg.start
+        self._restoring = True
+        try:
+            cpu.restore(seg.blob)
+            if count:
+                image = bytearray(memoryview(seg.blob)[_state.size:])
+                addrs, vals = seg.addrs, seg.vals
+                for i in range(seg.ends[count - 1]):
+                    image[addrs[i]] = vals[i]
+                cpu.ram.load(0x0, image)
+                regs = seg.regs[count - 1]
+                cpu.A, cpu.X, cpu.Y = regs & 0xff, (regs >> 8) & 0xff, (regs >> 16) & 0xff
+                cpu.SP, cpu.P, cpu.PC = (regs >> 24) & 0xff, (regs >> 32) & 0xff, regs >> 40
+                cpu.cycles = seg.cycles[count - 1]
+        finally:
+            self._restoring = False
+
+        writes = seg.ends[count - 1] if count else 0
+        del seg.regs[count:], seg.cycles[count:], seg.ends[count:]
+        del seg.addrs[writes:], seg.vals[writes:]
+        return position
+
+    def step_back(self, n=1):
+        return self.seek(self.position - n)
+
+    def run_back_to(self, pc):
+        # goes back to the latest recorded point where the cpu was at pc.
+        for seg in reversed(self._segments):
+            for count in range(len(seg.regs) - 1, -1, -1):
+                at = seg.regs[count - 1] >> 40 if count else _pc(seg.blob)
+                if at == pc:
+                    return self.seek(seg.start + count)
+        raise ValueError('pc %s not in the recorded history' % hex(pc))
+
+
+def _pack(a, x, y, sp, p, pc):
+    return a | (x << 8) | (y << 16) | (sp << 24) | (p << 32) | (pc << 40)
+
+
+def _pc(blob):
+    return _state.unpack_from(blob)[6]
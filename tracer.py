@@ -0,0 +1,137 @@
+#
+# execution tracer for c6502. Tracer.run() records the state before every
+# instruction into a preallocated ring buffer of fixed-size records and can
+# stream each filled ring to a gzip file; read_trace() decodes either back.
+
+import gzip
+import struct
+from collections import namedtuple
+
+import instructions
+from c6502 import RunResult, _dispatch
+
+
+_record = struct.Struct('<HBHBBBBBQ')  # pc, opcode, operand, a, x, y, p, sp, cycles
+_magic = b'C65T\x01'
+
+Record = namedtuple('Record', 'pc opcode operand a x y p sp cycles')
+
+_sizes = bytes(instructions.get_size(opcode)
+               if opcode in instructions._instructions else 1
+               for opcode in range(0x100))
+
+
+class Tracer:
+    def __init__(self, cpu, depth=0x1000, path=None):
+        self.cpu = cpu
+        self.depth = depth
+        self._buf = bytearray(depth * _record.size)
+        self._pos = 0  # next slot
+        self.count = 0  # records taken in total
+        self._out = None
+        if path is not None:
+            self._out = gzip.open(path, 'wb')
+            self._out.write(_magic)
+
+    def close(self):
+        if self._out is not None:
+            self._out.write(self._buf[:self._pos * _record.size])
+            self._out.close()
+            self._out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, cycles=None, until_pc=None, max_instructions=None,
+            until=None, brk=True):
+        # same contract as C6502.run.
+        cpu, dispatch, ram = self.cpu, _dispatch, self.cpu.ram
+        buf, pack, size, sizes = self._buf, _record.pack_into, _record.size, _sizes
+        depth, pos = self.depth, self._pos
+
+        start = cpu.cycles
+        deadline = float('inf') if cycles is None else start + cycles
+        limit = -1 if max_instructions is None else max_instructions
+        stop_pc = -1 if until_pc is None else until_pc
+        stop_op = 0x00 if brk else -1
+        count, reason = 0, 'instructions'
+        cpu._arm(deadline)
+
+        while count != limit:
+            if cpu.cycles >= cpu._deadline:
+                if cpu.cycles >= deadline:
+                    reason = 'cycles'
+                    break
+                cpu._service()
+                continue
+            pc = cpu.PC
+            opcode = ram.read(pc)
+            if opcode == stop_op:
+                reason = 'brk'
+                break
+            length = sizes[opcode]
+            if length == 1:
+                operand = 0
+            elif length == 2:
+                operand = ram.read((pc + 1) & 0xffff)
+            else:
+                operand = (ram.read((pc + 1) & 0xffff) |
+                           (ram.read((pc + 2) & 0xffff) << 8))
+            pack(buf, pos * size, pc, opcode, operand, cpu.A, cpu.X, cpu.Y,
+                 cpu.P, cpu.SP, cpu.cycles)
+            pos += 1
+            if pos == depth:
+                if self._out is not None:
+                    self._out.write(buf)
+                pos = 0
+
+            dispatch[opcode](cpu)
+            count += 1
+            if cpu.PC == stop_pc:
+                reason = 'pc'
+                break
+            if until is not None and until(cpu):
+                reason = 'until'
+                break
+
+        self._pos = pos
+        self.count += count
+        return RunResult(count, cpu.cycles - start, reason)
+
+    def records(self, last=None):
+        # the newest records still in the ring, oldest first.
+        held = min(self.count, self.depth)
+        last = held if last is None else min(last, held)
+        first = (self._pos - last) % self.depth
+        return [Record(*_record.unpack_from(self._buf, (slot % self.depth) *
+                                            _record.size))
+                for slot in range(first, first + last)]
+
+
+#
+# reading back.
+
+def read_trace(path):
+    # yields the Records streamed to path.
+    with gzip.open(path, 'rb') as f:
+        if f.read(len(_magic)) != _magic:
+            raise ValueError('not a c6502 trace')
+        while True:
+            chunk = f.read(_record.size * 0x1000)
+            if not chunk:
+                break
+            for fields in _record.iter_unpack(chunk):
+                yield Record(*fields)
+
+
+def format_record(rec):
+    size = _sizes[rec.opcode]
+    raw = ' '.join('%02x' % b for b in
+                   (rec.opcode, rec.operand & 0xff, rec.operand >> 8)[:size])
+    text = instructions.disassemble(rec.opcode, rec.operand if size > 1 else None,
+                                    rec.pc)
+    return '%04x  %-8s  %-13s A=%02x X=%02x Y=%02x P=%02x SP=%02x CYC=%d' % (
+        rec.pc, raw, text, rec.a, rec.x, rec.y, rec.p, rec.sp, rec.cycles)
@@ -0,0 +1,301 @@
+#
+# basic-block translator for c6502. straight-line code up to the next branch,
+# JMP, JSR, RTS, RTI, CLI or PLP is compiled into one python function and
+# cached by start address; writes to translated bytes throw the affected
+# blocks away.
+
+import re
+
+import instructions
+from c6502 import C6502, RunResult, _dispatch
+from instructionset import *
+from instructionset import _adc, _nz, _sbc
+
+
+_max_length = 32  # instructions per block
+
+_loads = {LDA: 'A', LDX: 'X', LDY: 'Y'}
+_stores = {STA: 'A', STX: 'X', STY: 'Y'}
+_transfers = {TAX: ('A', 'X'), TAY: ('A', 'Y'), TXA: ('X', 'A'),
+              TYA: ('Y', 'A'), TSX: ('SP', 'X')}
+_steps = {INX: ('X', 1), INY: ('Y', 1), DEX: ('X', -1), DEY: ('Y', -1)}
+_logic = {AND: '&', ORA: '|', EOR: '^'}
+_compares = {CMP: 'A', CPX: 'X', CPY: 'Y'}
+_arithmetic = {ADC: 'adc', SBC: 'sbc'}
+_flags = {CLC: '&= 0xfe', SEC: '|= 0x01', CLD: '&= 0xf7', SED: '|= 0x08',
+          SEI: '|= 0x04', CLV: '&= 0xbf'}
+_branches = {BCC: 'not cpu.P & 0x01', BCS: 'cpu.P & 0x01',
+             BNE: 'not cpu.P & 0x02', BEQ: 'cpu.P & 0x02',
+             BPL: 'not cpu.P & 0x80', BMI: 'cpu.P & 0x80',
+             BVC: 'not cpu.P & 0x40', BVS: 'cpu.P & 0x40'}
+_ends = (JMP, JSR, RTS, RTI, CLI, PLP)  # the last two may unmask an irq
+
+_namespace = {'nz': _nz, 'adc': _adc, 'sbc': _sbc}
+_namespace.update(('f_' + func.__name__, func)
+                  for func, mode, cycles in instructions._instructions.values())
+_namespace.update(('m_' + mode, addr) for mode, addr in C6502.addr_modes.items())
+_namespace.update(('p_' + mode, addr) for mode, addr in C6502.paged_modes.items())
+
+
+class _Block:
+    __slots__ = ('start', 'end', 'length', 'budget', 'stale', 'run')
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.length = 0
+        self.budget = 0  # worst case cycles before its last instruction, + 1
+        self.stale = False
+        self.run = None
+
+
+#
+# code generation.
+
+def _address(opcode, mode, arg):
+    if mode in ('zpg', 'abs'):
+        return '0x%04x' % arg
+    if mode in ('zpx', 'zpy'):
+        return '(0x%02x + cpu.%s) & 0xff' % (arg, mode[2].upper())
+    prefix = 'p_' if instructions.has_page_penalty(opcode) else 'm_'
+    return '%s%s(cpu, 0x%04x)' % (prefix, mode, arg)
+
+
+def _operand(opcode, mode, arg):
+    if mode == 'imm':
+        return '0x%02x' % arg
+    return 'ram.read(%s)' % _address(opcode, mode, arg)
+
+
+def _emit(lines, opcode, arg, pc, count):
+    # appends the body for one instruction; returns True if it ends the block.
+    func, mode, cycles = instructions._instructions[opcode]
+    lines.append('cpu.cycles += %d' % cycles)
+
+    if func in _branches:
+        target = (pc + (arg - 0x100 if arg & 0x80 else arg)) & 0xffff
+        lines.append('if %s:' % _branches[func])
+        lines.append('    cpu.cycles += %d' % (2 if (pc ^ target) & 0xff00 else 1))
+        lines.append('    cpu.PC = 0x%04x' % target)
+        lines.append('else:')
+        lines.append('    cpu.PC = 0x%04x' % pc)
+        lines.append('return %d' % count)
+        return True
+    if func is JMP and mode == 'abs':
+        lines.append('cpu.PC = 0x%04x' % arg)
+        lines.append('return %d' % count)
+        return True
+
+    if func in _loads and mode == 'imm':
+        lines.append('cpu.%s = 0x%02x' % (_loads[func], arg))
+        lines.append('cpu.P = (cpu.P & 0x7d) | 0x%02x' % _nz[arg])
+    elif func in _loads:
+        lines.append('v = %s' % _operand(opcode, mode, arg))
+        lines.append('cpu.%s = v' % _loads[func])
+        lines.append('cpu.P = (cpu.P & 0x7d) | nz[v]')
+    elif func in _transfers:
+        lines.append('v = cpu.%s' % _transfers[func][0])
+        lines.append('cpu.%s = v' % _transfers[func][1])
+        lines.append('cpu.P = (cpu.P & 0x7d) | nz[v]')
+    elif func in _steps:
+        reg, delta = _steps[func]
+        lines.append('v = (cpu.%s %+d) & 0xff' % (reg, delta))
+        lines.append('cpu.%s = v' % reg)
+        lines.append('cpu.P = (cpu.P & 0x7d) | nz[v]')
+    elif func in _logic:
+        lines.append('v = cpu.A %s %s' % (_logic[func], _operand(opcode, mode, arg)))
+        lines.append('cpu.A = v')
+        lines.append('cpu.P = (cpu.P & 0x7d) | nz[v]')
+    elif func in _compares:
+        lines.append('v = cpu.%s - %s' % (_compares[func], _operand(opcode, mode, arg)))
+        lines.append('cpu.P = (cpu.P & 0x7c) | nz[v & 0xff] | (v >= 0)')
+    elif func in _arithmetic:
+        lines.append('p = cpu.P')
+        lines.append('v = %s[((p & 0x08) << 14) | ((p & 0x01) << 16) | '
+                     '(cpu.A << 8) | %s]' % (_arithmetic[func],
+                                            _operand(opcode, mode, arg)))
+        lines.append('cpu.A = v & 0xff')
+        lines.append('cpu.P = (p & 0x3c) | (v >> 8)')
+    elif func in _flags:
+        lines.append('cpu.P %s' % _flags[func])
+    elif func is NOP:
+        pass
+    elif func in _stores:
+        lines.append('ram.write(%s, cpu.%s)' % (_address(opcode, mode, arg),
+                                               _stores[func]))
+        _emit_check(lines, pc, count)
+    else:
+        if mode in ('imp', 'acc'):
+            arg = 'None'
+        elif mode == 'imm':
+            arg = '0x%02x' % arg
+        else:
+            arg = _address(opcode, mode, arg)
+        lines.append('cpu.PC = 0x%04x' % pc)
+        lines.append("f_%s(cpu, '%s', %s)" % (func.__name__, mode, arg))
+        if func in _ends:
+            lines.append('return %d' % count)
+            return True
+        _emit_check(lines, pc, count)
+
+    return False
+
+
+def _emit_check(lines, pc, count):
+    # a write may have landed on this very block, raised an interrupt or
+    # brought the next event closer than the rest of the block may take;
+    # @count@ becomes the worst case cycles before its last instruction.
+    lines.append('if blk.stale or cpu.cycles + @%d@ >= cpu._deadline:' % count)
+    lines.append('    cpu.PC = 0x%04x' % pc)
+    lines.append('    return %d' % count)
+
+
+#
+# translator.
+
+class Translator:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self._blocks = {}  # start pc: block
+        self._pages = {}  # page: blocks touching it
+        self._covered = bytearray(0x10000)
+        self._stops = set()  # blocks never run through these addresses
+        cpu.ram.add_listener(self.invalidate)
+
+    def translate(self, pc):
+        # returns None if pc starts with something blocks leave to the
+        # interpreter (BRK, an invalid opcode).
+        read = self.cpu.ram.read
+        blk = _Block(pc)
+        lines, costs = [], []  # costs: worst case cycles per instruction
+
+        while blk.length < _max_length:
+            opcode = read(pc)
+            if not opcode or opcode not in instructions._instructions:
+                break
+            if blk.length and pc in self._stops:
+                break
+            size = instructions.get_size(opcode)
+            if pc + size >= 0x10000:  # left to the interpreter, which wraps
+                break
+            if size == 2:
+                arg = read(pc + 1)
+            elif size == 3:
+                arg = (read(pc + 2) << 8) | read(pc + 1)
+            else:
+                arg = None
+            pc += size
+            blk.length += 1
+            costs.append(instructions.get_cycles(opcode) +
+                         instructions.has_page_penalty(opcode))
+            if _emit(lines, opcode, arg, pc, blk.length):
+                break
+
+        if not blk.length:
+            return None
+        if not lines[-1].startswith('return'):
+            lines.append('cpu.PC = 0x%04x' % pc)
+            lines.append('return %d' % blk.length)
+
+        blk.end = pc
+        blk.budget = sum(costs[:-1]) + 1  # branches only come last
+        src = 'def block(cpu):\n    ram = cpu.ram\n    ' + '\n    '.join(lines)
+        src = re.sub(r'@(\d+)@', lambda m: str(sum(costs[int(m.group(1)):-1])),
+                     src)
+        namespace = dict(_namespace, blk=blk)
+        exec(compile(src, '<block 0x%04x>' % blk.start, 'exec'), namespace)
+        blk.run = namespace['block']
+
+        self._blocks[blk.start] = blk
+        self._covered[blk.start:blk.end] = b'\x01' * (blk.end - blk.start)
+        for page in range(blk.start >> 8, ((blk.end - 1) >> 8) + 1):
+            self._pages.setdefault(page, []).append(blk)
+            self.cpu.ram.add_hook(page, self._on_write)
+
+        return blk
+
+    def _on_write(self, addr, val):
+        if self._covered[addr] and self.cpu.ram.read(addr) != val:
+            self.invalidate(addr, addr + 1)
+
+    def invalidate(self, start, end):
+        # drops every block overlapping [start, end).
+        if end <= start:
+            return
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            for blk in list(self._pages.get(page, ())):
+                if blk.start < end and start < blk.end:
+                    self._discard(blk)
+
+    def _discard(self, blk):
+        blk.stale = True
+        if self._blocks.get(blk.start) is blk:
+            del self._blocks[blk.start]
+        for page in range(blk.start >> 8, ((blk.end - 1) >> 8) + 1):
+            blocks = self._pages[page]
+            if blk in blocks:
+                blocks.remove(blk)
+
+    def flush(self):
+        for blk in list(self._blocks.values()):
+            blk.stale = True
+        for page in self._pages:
+            self.cpu.ram.remove_hook(page, self._on_write)
+        self._blocks.clear()
+        self._pages.clear()
+        self._covered[:] = bytes(0x10000)
+
+    def _stop_at(self, pc):
+        if pc not in self._stops:
+            self._stops.add(pc)
+            for blk in list(self._pages.get(pc >> 8, ())):
+                if blk.start < pc < blk.end:
+                    self._discard(blk)
+
+    def run(self, cycles=None, until_pc=None, max_instructions=None,
+            until=None, brk=True):
+        # same contract as C6502.run. whole blocks run only while they fit in
+        # the instruction and cycle budgets; the rest is stepped singly, so
+        # until(cpu) is the one condition checked per block, not per
+        # instruction. blocks also stop short of the next scheduled event,
+        # and interrupts are taken between blocks.
+        cpu, blocks, translate = self.cpu, self._blocks, self.translate
+        dispatch, ram = _dispatch, cpu.ram
+        start = cpu.cycles
+        deadline = float('inf') if cycles is None else start + cycles
+        limit = float('inf') if max_instructions is None else max_instructions
+        stop_pc = -1 if until_pc is None else until_pc
+        stop_op = 0x00 if brk else -1
+        count, reason = 0, 'instructions'
+
+        if until_pc is not None:
+            self._stop_at(until_pc)
+        cpu._arm(deadline)
+
+        while count < limit:
+            if cpu.cycles >= cpu._deadline:
+                if cpu.cycles >= deadline:
+                    reason = 'cycles'
+                    break
+                cpu._service()
+                continue
+            pc = cpu.PC
+            blk = blocks.get(pc) or translate(pc)
+            if (blk is not None and count + blk.length <= limit and
+                    cpu.cycles + blk.budget <= cpu._deadline):
+                count += blk.run(cpu)
+            else:
+                opcode = ram.read(pc)
+                if opcode == stop_op:
+                    reason = 'brk'
+                    break
+                dispatch[opcode](cpu)
+                count += 1
+            if cpu.PC == stop_pc:
+                reason = 'pc'
+                break
+            if until is not None and until(cpu):
+                reason = 'until'
+                break
+
+        return RunResult(count, cpu.cycles - start, reason)
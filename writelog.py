@@ -0,0 +1,101 @@
+#
+# opt-in write tracking for c6502 memory, for observers (screens, mirrors,
+# dashboards) that want what changed rather than all 64K. every write is
+# stamped with a sequence number, per byte and per page, so any number of
+# consumers can each ask for what changed since the seq they last saw; a
+# pull costs in proportion to the pages written, not to memory size.
+# optionally, (addr, old, new, cycle) records are kept as well.
+
+from array import array
+
+
+class WriteLog:
+    def __init__(self, cpu, records=False, limit=0x10000):
+        self.cpu = cpu
+        self.ram = cpu.ram
+        self.seq = 0  # stamp of the latest write
+        self._stamps = array('Q', bytes(0x80000))  # per byte
+        self._pages = array('Q', bytes(0x800))  # per page
+        self.limit = limit  # records kept, at most
+        self._records = [] if records else None
+        self._base = 0  # seq before the oldest record kept
+
+        for page in range(0x100):
+            cpu.ram.add_hook(page, self._on_write)
+        cpu.ram.add_listener(self._on_load)
+
+    def close(self):
+        for page in range(0x100):
+            self.ram.remove_hook(page, self._on_write)
+        self.ram.remove_listener(self._on_load)
+
+    #
+    # tracking.
+
+    def _on_write(self, addr, val):
+        seq = self.seq = self.seq + 1
+        self._stamps[addr] = seq
+        self._pages[addr >> 8] = seq
+        records = self._records
+        if records is not None:
+            ram = self.ram
+            old = ram.peek(addr) if ram._writers[addr >> 8] is None else None
+            records.append((addr, old, val, self.cpu.cycles))
+            if len(records) > self.limit:
+                drop = len(records) - self.limit // 2
+                del records[:drop]
+                self._base += drop
+
+    def _on_load(self, start, end):
+        # bulk loads mark their range but leave no records; record readers
+        # from before it have to resync.
+        if start >= end:
+            return
+        seq = self.seq = self.seq + 1
+        self._stamps[start:end] = array('Q', [seq]) * (end - start)
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            self._pages[page] = seq
+        if self._records is not None:
+            del self._records[:]
+            self._base = seq
+
+    #
+    # pulling; since is the seq a consumer last synced at, 0 for everything.
+
+    def dirty_pages(self, since=0):
+        pages = self._pages
+        return [page for page in range(0x100) if pages[page] > since]
+
+    def bitmap(self, page, since=0):
+        # 32 bytes, bit n of byte i set if page byte i * 8 + n was written.
+        stamps, base = self._stamps, page << 8
+        bits = bytearray(0x20)
+        for i in range(0x100):
+            if stamps[base + i] > since:
+                bits[i >> 3] |= 1 << (i & 7)
+        return bytes(bits)
+
+    def changes(self, since=0):
+        # (seq, [addr, ...]) written since, in address order.
+        stamps, addrs = self._stamps, []
+        for page in self.dirty_pages(since):
+            base = page << 8
+            addrs.extend(addr for addr in range(base, base + 0x100)
+                         if stamps[addr] > since)
+        return self.seq, addrs
+
+    def delta(self, since=0):
+        # (seq, [(addr, value now), ...]) for a state mirror to apply.
+        seq, addrs = self.changes(since)
+        peek = self.ram.peek
+        return seq, [(addr, peek(addr)) for addr in addrs]
+
+    def records(self, since=0):
+        # (seq, [(addr, old, new, cycle), ...]) in write order. old is None
+        # for writes to devices. raises ValueError if records after since
+        # have been dropped (limit, bulk loads); resync with delta().
+        if self._records is None:
+            raise ValueError('records are off')
+        if since < self._base:
+            raise ValueError('records since %d dropped' % since)
+        return self.seq, self._records[since - self._base:]